@@ -0,0 +1,32 @@
+# benchmarks, run from the project root as e.g. `python -m benchmarks.sessions`.
+# each one runs against a throwaway test database and prints its results as
+# JSON on stdout
+import json
+import os
+import sys
+import tempfile
+
+_cache_dir = tempfile.TemporaryDirectory()
+
+def setup(database=None):
+    # configure django and create a fresh, migrated test database, in memory
+    # unless a database file is given. the on-disk caches move to a throwaway
+    # directory too
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myblog.settings')
+    from django.conf import settings
+    for alias, config in settings.CACHES.items():
+        if config['BACKEND'].endswith('.FileBasedCache'):
+            config['LOCATION'] = os.path.join(_cache_dir.name, alias)
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    if database is not None:
+        connection.settings_dict['TEST']['NAME'] = database
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+def report(results):
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
@@ -0,0 +1,242 @@
+# drives every route in blog/urls.py through myblog.wsgi.application, in
+# process, against a database filled by the seed_blog command. reports
+# throughput, latency percentiles, SQL queries per request and peak Python
+# memory per endpoint, tagged with the current commit so runs can be compared
+import argparse
+import io
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+from http.cookies import SimpleCookie
+from . import setup, report
+
+class Driver:
+    # a minimal in-process WSGI client
+
+    def __init__(self, application):
+        self.application = application
+
+    def request(self, method, path, query='', body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(data)),
+            'REMOTE_ADDR': '127.0.0.1',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(data),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': False,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in (headers or {}).items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+
+        started = []
+        def start_response(status, response_headers, exc_info=None):
+            started.append((int(status.split()[0]), response_headers))
+
+        result = self.application(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            result.close()
+        status, response_headers = started[0]
+        return status, response_headers, content
+
+    def cookies(self, response_headers):
+        cookie = SimpleCookie()
+        for name, value in response_headers:
+            if name == 'Set-Cookie':
+                cookie.load(value)
+        return {key: morsel.value for key, morsel in cookie.items()}
+
+def scenarios(driver, password):
+    # (route name, label, make request) for every endpoint. make(i) returns
+    # the i-th request's arguments, after doing any untimed setup it needs
+    from django.contrib.auth.models import User
+    from blog.auth import issue_token
+    from blog.models import Article, Comment
+
+    def bearer(uid):
+        return {'Authorization': f'Bearer {issue_token(User(id=uid))}'}
+
+    _, response_headers, _ = driver.request('GET', '/api/token/')
+    csrftoken = driver.cookies(response_headers)['csrftoken']
+    csrf = {'Cookie': f'csrftoken={csrftoken}', 'X-CSRFToken': csrftoken}
+
+    username = User.objects.filter(username__startswith='seed-user-').order_by('id').values_list('username', flat=True)[0]
+    reader = bearer(User.objects.get(username=username).id)
+    article_ids = list(Article.objects.order_by('id').values_list('id', flat=True))
+    # the first article has the longest comment thread
+    hot = article_ids[0]
+    article = Article.objects.order_by('id').values('id', 'author_id')[0]
+    author = bearer(article['author_id'])
+    comment_ids = list(Comment.objects.order_by('id').values_list('id', flat=True))
+    comment = Comment.objects.order_by('id').values('id', 'author_id')[0]
+    commenter = bearer(comment['author_id'])
+
+    def nth(i):
+        return article_ids[i % len(article_ids)]
+
+    def nth_comment(i):
+        return comment_ids[i % len(comment_ids)]
+
+    def signout(i):
+        _, response_headers, _ = driver.request('POST', '/api/signin/', body={'username': username, 'password': password}, headers=csrf)
+        sessionid = driver.cookies(response_headers)['sessionid']
+        return {'method': 'GET', 'path': '/api/signout/', 'headers': {'Cookie': f'sessionid={sessionid}'}}
+
+    def new_article():
+        _, _, content = driver.request('POST', '/api/article/', body={'title': 'title', 'content': 'content'}, headers=author)
+        return json.loads(content)['id']
+
+    def new_comment():
+        _, _, content = driver.request('POST', f'/api/article/{hot}/comment/', body={'content': 'content'}, headers=commenter)
+        return json.loads(content)['id']
+
+    return [
+        ('signup', 'POST /api/signup/', lambda i: {'method': 'POST', 'path': '/api/signup/',
+            'body': {'username': f'bench-signup-{i}', 'password': password}, 'headers': csrf}),
+        ('signin', 'POST /api/signin/', lambda i: {'method': 'POST', 'path': '/api/signin/',
+            'body': {'username': username, 'password': password}, 'headers': csrf}),
+        ('signout', 'GET /api/signout/', signout),
+        ('bearer', 'POST /api/bearer/', lambda i: {'method': 'POST', 'path': '/api/bearer/',
+            'body': {'username': username, 'password': password}, 'headers': csrf}),
+        ('token', 'GET /api/token/', lambda i: {'method': 'GET', 'path': '/api/token/'}),
+        ('articles', 'GET /api/article/', lambda i: {'method': 'GET', 'path': '/api/article/',
+            'query': f'after={nth(i * 7)}', 'headers': reader}),
+        ('articles', 'POST /api/article/', lambda i: {'method': 'POST', 'path': '/api/article/',
+            'body': {'title': 'title', 'content': 'content'}, 'headers': reader}),
+        ('article-search', 'GET /api/article/search/', lambda i: {'method': 'GET', 'path': '/api/article/search/',
+            'query': 'q=alpha', 'headers': reader}),
+        ('article', 'GET /api/article/<id>/', lambda i: {'method': 'GET', 'path': f'/api/article/{nth(i)}/',
+            'headers': reader}),
+        ('article', 'PUT /api/article/<id>/', lambda i: {'method': 'PUT', 'path': f'/api/article/{article["id"]}/',
+            'body': {'title': f'title{i}', 'content': 'content'}, 'headers': author}),
+        ('article', 'DELETE /api/article/<id>/', lambda i: {'method': 'DELETE', 'path': f'/api/article/{new_article()}/',
+            'headers': author}),
+        ('article-comment', 'GET /api/article/<id>/comment/', lambda i: {'method': 'GET', 'path': f'/api/article/{hot}/comment/',
+            'headers': reader}),
+        ('article-comment', 'POST /api/article/<id>/comment/', lambda i: {'method': 'POST', 'path': f'/api/article/{nth(i)}/comment/',
+            'body': {'content': 'content'}, 'headers': reader}),
+        ('comments', 'GET /api/comment/<id>/', lambda i: {'method': 'GET', 'path': f'/api/comment/{nth_comment(i)}/',
+            'headers': reader}),
+        ('comments', 'PUT /api/comment/<id>/', lambda i: {'method': 'PUT', 'path': f'/api/comment/{comment["id"]}/',
+            'body': {'content': f'content{i}'}, 'headers': commenter}),
+        ('comments', 'DELETE /api/comment/<id>/', lambda i: {'method': 'DELETE', 'path': f'/api/comment/{new_comment()}/',
+            'headers': commenter}),
+        ('cache-stats', 'GET /api/cache/stats/', lambda i: {'method': 'GET', 'path': '/api/cache/stats/',
+            'headers': reader}),
+    ]
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def measure(driver, make, requests, memory_requests):
+    from django.db import connection
+
+    queries = [0]
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    # each request gets its own index, some scenarios need distinct requests
+    indexes = iter(range(sys.maxsize))
+
+    # warm up caches and connections
+    for _ in range(min(5, requests)):
+        driver.request(**make(next(indexes)))
+
+    latencies = []
+    errors = total_queries = 0
+    with connection.execute_wrapper(count):
+        for _ in range(requests):
+            kwargs = make(next(indexes))
+            queries[0] = 0
+            start = time.perf_counter()
+            status, _, _ = driver.request(**kwargs)
+            latencies.append(time.perf_counter() - start)
+            total_queries += queries[0]
+            errors += status >= 400
+
+    # separately, as tracing slows everything down
+    peak = 0
+    tracemalloc.start()
+    for _ in range(memory_requests):
+        kwargs = make(next(indexes))
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        driver.request(**kwargs)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    return {
+        'requests': requests,
+        'errors': errors,
+        'requests_per_second': requests / sum(latencies),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'queries_per_request': total_queries / requests,
+        'peak_memory_bytes': peak if memory_requests else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--articles', type=int, default=1000)
+    parser.add_argument('--comments', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=100, help='timed requests per endpoint')
+    parser.add_argument('--memory-requests', type=int, default=5, help='requests per endpoint traced for peak memory')
+    parser.add_argument('--only', help='only run endpoints whose label contains this')
+    args = parser.parse_args()
+
+    setup()
+    from django.conf import settings
+    from django.core.management import call_command
+    from blog.urls import urlpatterns
+    from myblog.wsgi import application
+
+    # the auth endpoints are hit far beyond any sane rate limit here
+    settings.BLOG_THROTTLE_RATES = {}
+    password = 'password'
+    call_command('seed_blog', users=args.users, articles=args.articles, comments=args.comments,
+            seed=args.seed, password=password, stdout=io.StringIO())
+
+    driver = Driver(application)
+    endpoints = scenarios(driver, password)
+    missing = {pattern.name for pattern in urlpatterns} - {name for name, _, _ in endpoints}
+    if missing:
+        raise SystemExit(f'no benchmark for routes: {", ".join(sorted(missing))}')
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    results = {}
+    for _, label, make in endpoints:
+        if args.only and args.only not in label:
+            continue
+        results[label] = measure(driver, make, args.requests, args.memory_requests)
+
+    report({
+        'commit': commit,
+        'arguments': vars(args),
+        'endpoints': results,
+    })
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# time and peak Python memory of deleting an article with a large comment
+# thread, through Model.delete() and QuerySet.delete(), and a user with many
+# articles, through Model.delete() and blog.deletion.delete_user()
+import argparse
+import time
+import tracemalloc
+from . import setup, report
+
+def populate(articles, comments):
+    # a user with articles, the first of which has all the comments
+    from django.contrib.auth.models import User
+    from blog.models import Article, Comment
+
+    user = User.objects.create_user(username=f'bench-{User.objects.count()}', password='bench')
+    Article.objects.bulk_create(Article(title='title', content='content', author=user) for _ in range(articles))
+    first = Article.objects.filter(author=user).order_by('id').first()
+    Comment.objects.bulk_create(Comment(article=first, content='content', author=user) for _ in range(comments))
+    return user, first
+
+def measure(delete):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        delete()
+        elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'ms': elapsed * 1000,
+        'queries': len(queries),
+        'peak_memory_bytes': peak,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--comments', type=int, default=100000, help='comments on the deleted article')
+    parser.add_argument('--articles', type=int, default=10000, help='articles by the deleted user')
+    args = parser.parse_args()
+
+    setup()
+    from blog.deletion import delete_user
+    from blog.models import Article
+
+    results = {}
+    _, article = populate(1, args.comments)
+    results['article.delete()'] = measure(article.delete)
+    _, article = populate(1, args.comments)
+    results['queryset.delete()'] = measure(Article.objects.filter(id=article.id).delete)
+
+    user, _ = populate(args.articles, args.comments)
+    results['user.delete()'] = measure(user.delete)
+    user, _ = populate(args.articles, args.comments)
+    results['delete_user()'] = measure(lambda: delete_user(user))
+
+    report({
+        'arguments': vars(args),
+        'results': results,
+    })
+
+if __name__ == '__main__':
+    main()
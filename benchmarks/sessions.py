@@ -0,0 +1,46 @@
+# per-request queries and latency of an authenticated GET, with the plain
+# database session engine and with the cached_db engine from settings
+import argparse
+import time
+from . import setup, report
+
+def run(engine, requests):
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.test.utils import CaptureQueriesContext
+
+    with override_settings(SESSION_ENGINE=engine):
+        client = Client()
+        client.force_login(User.objects.get(username='bench'))
+        # the first request after login may still fill the cache
+        client.get('/api/article/')
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(requests):
+                client.get('/api/article/')
+            elapsed = time.perf_counter() - start
+
+    return {
+        'queries_per_request': len(queries) / requests,
+        'session_queries_per_request': sum('django_session' in query['sql'] for query in queries) / requests,
+        'ms_per_request': elapsed * 1000 / requests,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    User.objects.create_user(username='bench', password='bench')
+
+    report({
+        'db': run('django.contrib.sessions.backends.db', args.requests),
+        'cached_db': run('django.contrib.sessions.backends.cached_db', args.requests),
+    })
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# throughput and "database is locked" rate of the comment endpoints under N
+# reader and M writer processes, like the workers of a multi-process server,
+# with django's default sqlite setup (rollback journal, a new connection per
+# request) and with the tuned profile from settings (SQLITE_PRAGMAS,
+# persistent connections). reads bypass the blog cache so they reach the
+# database. both wait up to 5 s for a lock by default, --busy-timeout sets a
+# shorter wait for both, for lock errors to show within a request's budget
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from . import setup, report
+
+def configure(profile, busy_timeout):
+    # the settings a worker runs with under profile, call before opening
+    # any connection
+    from django.conf import settings
+
+    if profile == 'default':
+        settings.SQLITE_PRAGMAS = {'journal_mode': 'DELETE'}
+        settings.DATABASES['default']['CONN_MAX_AGE'] = 0
+    if busy_timeout is not None:
+        settings.SQLITE_PRAGMAS = dict(settings.SQLITE_PRAGMAS, busy_timeout=busy_timeout)
+    settings.CACHES['blog'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    settings.CACHES['blog_tokens'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+
+def worker(kind, profile, busy_timeout, database, seconds, token, aid, barrier, results):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myblog.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = database
+    configure(profile, busy_timeout)
+
+    import django
+    django.setup()
+    from django.db import OperationalError, connections
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+    done = errors = 0
+    # every process starts once all of them are ready
+    barrier.wait()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            if kind == 'reads':
+                response = client.get(f'/api/article/{aid}/comment/', {'limit': 20})
+            else:
+                response = client.post(f'/api/article/{aid}/comment/', {'content': 'content'},
+                        content_type='application/json')
+            done += response.status_code < 300
+        except OperationalError:
+            errors += 1
+    connections.close_all()
+    results.put((kind, done, errors))
+
+def run(profile, busy_timeout, readers, writers, seconds, database, token, aid):
+    from django.db import connection, connections
+
+    # switching the journal mode needs the only connection to the file
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA journal_mode = {"DELETE" if profile == "default" else "WAL"}')
+    connections.close_all()
+
+    # spawned, so that no process inherits another's open connection
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(readers + writers)
+    results = context.Queue()
+    processes = [context.Process(target=worker,
+            args=(kind, profile, busy_timeout, database, seconds, token, aid, barrier, results))
+            for kind in ['reads'] * readers + ['writes'] * writers]
+    for process in processes:
+        process.start()
+
+    counts = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+    for _ in processes:
+        kind, done, errors = results.get()
+        counts[kind] += done
+        counts[kind[:-1] + '_errors'] += errors
+    for process in processes:
+        process.join()
+
+    writes = counts['writes'] + counts['write_errors']
+    return {
+        'reads_per_second': counts['reads'] / seconds,
+        'writes_per_second': counts['writes'] / seconds,
+        'read_errors': counts['read_errors'],
+        'write_errors': counts['write_errors'],
+        'write_error_rate': counts['write_errors'] / writes if writes else 0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--busy-timeout', type=int, help='ms to wait for a lock, for both profiles')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # processes need a shared database file, not a private in-memory one
+        database = os.path.join(directory, 'bench.sqlite3')
+        setup(database)
+
+        from django.contrib.auth.models import User
+        from blog.auth import issue_token
+        from blog.models import Article
+
+        user = User.objects.create_user(username='bench', password='bench')
+        aid = Article.objects.create(title='title', content='content', author=user).id
+        token = issue_token(user)
+
+        report({
+            profile: run(profile, args.busy_timeout, args.readers, args.writers, args.seconds, database, token, aid)
+            for profile in ['default', 'tuned']
+        })
+
+if __name__ == '__main__':
+    main()
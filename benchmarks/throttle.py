@@ -0,0 +1,123 @@
+# latency of a cheap read endpoint in one process while other processes,
+# like the other workers of a multi-process server, flood signin with wrong
+# passwords, each of which costs a password hash: with no flood, with the
+# flood and no rate limits, and with the flood and BLOG_THROTTLE_RATES. each
+# flooder sends --rate requests per second, or as many as it can once it
+# falls behind
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from . import setup, report
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def worker(kind, rates, rate, directory, seconds, token, barrier, results):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myblog.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+    # buckets and blog cache tokens shared by all the processes, as in
+    # settings, but not the project's own
+    settings.CACHES['throttle']['LOCATION'] = os.path.join(directory, 'throttle')
+    settings.CACHES['blog_tokens']['LOCATION'] = os.path.join(directory, 'blog')
+    settings.BLOG_THROTTLE_RATES = rates
+
+    import django
+    django.setup()
+    import logging
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    # one warning per 401 and 429 otherwise
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+
+    latencies = []
+    statuses = {}
+    barrier.wait()
+    start = time.perf_counter()
+    deadline = start + seconds
+
+    if kind == 'reader':
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        while time.perf_counter() < deadline:
+            request_start = time.perf_counter()
+            client.get('/api/article/', {'limit': 20})
+            latencies.append(time.perf_counter() - request_start)
+    else:
+        client = Client()
+        sent = 0
+        while time.perf_counter() < deadline:
+            time.sleep(max(0, start + sent / rate - time.perf_counter()))
+            response = client.post('/api/signin/', {'username': 'bench', 'password': 'incorrect'},
+                    content_type='application/json')
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            sent += 1
+    results.put((latencies, statuses))
+
+def run(rates, flooders, rate, directory, seconds, token):
+    from django.core.cache import caches
+    from django.db import connections
+
+    caches['throttle'].clear()
+    connections.close_all()
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(1 + flooders)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(kind, rates, rate, directory, seconds, token, barrier, results))
+            for kind in ['reader'] + ['flooder'] * flooders]
+    for process in processes:
+        process.start()
+
+    latencies = []
+    statuses = {}
+    for _ in processes:
+        process_latencies, process_statuses = results.get()
+        latencies += process_latencies
+        for status, count in process_statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    for process in processes:
+        process.join()
+
+    return {
+        'reads_per_second': len(latencies) / seconds,
+        'read_p50_ms': percentile(latencies, 0.50) * 1000,
+        'read_p95_ms': percentile(latencies, 0.95) * 1000,
+        'read_p99_ms': percentile(latencies, 0.99) * 1000,
+        'signin_statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--flooders', type=int, default=8, help='processes flooding signin')
+    parser.add_argument('--rate', type=float, default=10, help='signins per second per flooder')
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # processes need a shared database file, not a private in-memory one
+        setup(os.path.join(directory, 'bench.sqlite3'))
+
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from blog.auth import issue_token
+        from blog.models import Article
+
+        settings.CACHES['throttle']['LOCATION'] = os.path.join(directory, 'throttle')
+        user = User.objects.create_user(username='bench', password='bench')
+        Article.objects.bulk_create(Article(title='title', content='content', author=user) for _ in range(100))
+        token = issue_token(user)
+        rates = settings.BLOG_THROTTLE_RATES
+
+        report({
+            'arguments': vars(args),
+            'no flood': run(rates, 0, args.rate, directory, args.seconds, token),
+            'flood, unthrottled': run({}, args.flooders, args.rate, directory, args.seconds, token),
+            'flood, throttled': run(rates, args.flooders, args.rate, directory, args.seconds, token),
+        })
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,18 @@
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from .deletion import delete_user
 
-# Register your models here.
+# users are deleted with deletion.delete_user, which removes their articles
+# and comments with a query per table instead of loading them through the
+# collector. importing UserAdmin above registered django's own first
+class BlogUserAdmin(UserAdmin):
+    def delete_model(self, request, obj):
+        delete_user(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            delete_user(user)
+
+admin.site.unregister(User)
+admin.site.register(User, BlogUserAdmin)
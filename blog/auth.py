@@ -0,0 +1,66 @@
+import hashlib
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+# stateless bearer tokens: the user id, timestamped and HMAC-signed with
+# SECRET_KEY. checking one needs no session lookup, only a (cached) user.
+#
+# like a session, a token also carries a digest of the user's session auth
+# hash, which is derived from their password hash: changing the password
+# revokes every token issued before, once the cached user expires
+
+SALT = 'blog.auth.token'
+
+def _auth_digest(user):
+    return hashlib.sha256(user.get_session_auth_hash().encode()).hexdigest()[:32]
+
+def issue_token(user):
+    return signing.dumps([user.id, _auth_digest(user)], salt=SALT)
+
+def _get_user(uid):
+    cache = caches['default']
+    key = f'blog:user:{uid}'
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.filter(id=uid, is_active=True).first()
+        if user is not None:
+            cache.set(key, user, settings.BLOG_TOKEN_USER_CACHE_TIMEOUT)
+    return user
+
+def authenticate_token(token):
+    # the token's user, or None if it is forged, expired, the user is gone or
+    # their password changed
+    try:
+        uid, digest = signing.loads(token, salt=SALT, max_age=settings.BLOG_TOKEN_MAX_AGE)
+    except (signing.BadSignature, TypeError, ValueError):
+        # tokens issued before the digest hold the bare id
+        return None
+    user = _get_user(uid)
+    if user is None or not constant_time_compare(digest, _auth_digest(user)):
+        return None
+    return user
+
+class BearerTokenMiddleware:
+    # must come after AuthenticationMiddleware, which would otherwise replace
+    # request.user with the session user
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if header.startswith('Bearer '):
+            user = authenticate_token(header[len('Bearer '):])
+            if user is None:
+                response = HttpResponse(status=401)
+                response['WWW-Authenticate'] = 'Bearer error="invalid_token"'
+                return response
+
+            request.user = user
+            # no cookies are involved, so there is nothing to forge
+            request._dont_enforce_csrf_checks = True
+        return self.get_response(request)
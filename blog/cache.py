@@ -0,0 +1,89 @@
+import threading
+import uuid
+from django.core.cache import caches
+from .routers import replica
+
+# read-through cache for article and comment reads, in the 'blog' cache alias
+# (see CACHES in settings for TTL and size limits).
+#
+# cached values are grouped under names like 'article:1:comments'. each name
+# has a random generation token that is part of the key of every value under
+# it, so invalidating a name only deletes the token: all the values filed under
+# the old token become unreachable and age out. a token that is evicted or
+# expires is replaced by a fresh one, which can never resurrect old values.
+#
+# the values are cached per process, but the tokens live in the 'blog_tokens'
+# alias that all worker processes share, so an invalidation in one process
+# reaches the values every process cached. the hit and miss counters are the
+# calling process's own.
+#
+# values read from a replica (see routers.py) are served but not cached: the
+# replica may predate the last invalidation, and caching it would hide the
+# change from clients pinned to the primary too.
+
+_MISSING = object()
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+def _cache():
+    return caches['blog']
+
+def _tokens():
+    return caches['blog_tokens']
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+def token(name):
+    cache = _tokens()
+    current = cache.get(name)
+    if current is None:
+        current = uuid.uuid4().hex
+        if not cache.add(name, current):
+            # someone else set it first, theirs wins
+            current = cache.get(name, current)
+    return current
+
+def key(name, *parts):
+    return ':'.join([name, token(name)] + [str(part) for part in parts])
+
+def get(key, load):
+    # return the value cached under key, or call load() and cache its result.
+    # None (e.g. no such row) is never cached
+    cache = _cache()
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _count('hits')
+        return value
+
+    _count('misses')
+    value = load()
+    if value is not None and replica() is None:
+        cache.set(key, value)
+    return value
+
+def get_many(keys, load):
+    # like get() for several keys at once. load(missing) is called with the
+    # keys that weren't cached and returns a dict of the values it found
+    cache = _cache()
+    values = cache.get_many(keys)
+    with _stats_lock:
+        _stats['hits'] += len(values)
+        _stats['misses'] += len(keys) - len(values)
+
+    missing = [key for key in keys if key not in values]
+    if missing:
+        loaded = {key: value for key, value in load(missing).items() if value is not None}
+        if replica() is None:
+            cache.set_many(loaded)
+        values.update(loaded)
+    return values
+
+def invalidate(*names):
+    _tokens().delete_many(names)
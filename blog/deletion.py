@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models import Count, F
+from . import cache
+from .models import Article, Comment
+
+# deleting users. Model.delete() has django's collector load every row it
+# can't remove with a single query into memory first: deleting a user loads
+# each of their articles to cascade to its comments. articles are deleted
+# with QuerySet.delete(), which already removes their comments in one query
+
+def uncount_comments(user):
+    # the user's comments are about to be deleted, keep comment_count right
+    # on the articles that outlive them. call inside the delete's
+    # transaction, cache names are invalidated once it commits
+    article_ids = list(Article.objects.filter(author=user).values_list('id', flat=True))
+    counts = (Comment.objects.filter(author=user).exclude(article__author=user)
+            .values('article_id').annotate(count=Count('id')).values_list('article_id', 'count'))
+
+    # every cached comment of theirs, see views._get_comment
+    names = ['articles', f'user:{user.id}:alive']
+    for aid, count in counts:
+        Article.objects.filter(id=aid).update(comment_count=F('comment_count') - count, version=F('version') + 1)
+        names += [f'article:{aid}', f'article:{aid}:comments']
+    for aid in article_ids:
+        names += [f'article:{aid}', f'article:{aid}:comments', f'article:{aid}:alive']
+
+    transaction.on_commit(lambda: cache.invalidate(*names))
+
+def delete_user(user):
+    # like user.delete(), with the user's articles and comments deleted up
+    # front, so that the collector finds nothing left to cascade to. used by
+    # the user admin, see admin.py.
+    #
+    # nothing refers to comments, so each delete of them is a single
+    # DELETE. the articles' comments are gone by then, but the collector
+    # would still load every article to look for them: the articles are
+    # deleted raw, which sends no delete signals for them, a receiver on
+    # Article must also be run from here
+    with transaction.atomic():
+        uncount_comments(user)
+        Comment.objects.filter(article__author=user).delete()
+        Comment.objects.filter(author=user).delete()
+        Article.objects.filter(author=user)._raw_delete(Article.objects.db)
+        user.delete()
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+# django's password hashers, with their work factors read from
+# BLOG_PASSWORD_WORK_FACTORS[algorithm] instead of fixed per django release.
+# the calibrate_hashers command suggests values for the host. a stored hash
+# made with other work factors fails must_update(), so django re-hashes it
+# with the current ones on the user's next successful login
+
+def _work_factor(name):
+    return property(lambda self: settings.BLOG_PASSWORD_WORK_FACTORS[self.algorithm][name])
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    iterations = _work_factor('iterations')
+
+class PBKDF2SHA1PasswordHasher(hashers.PBKDF2SHA1PasswordHasher):
+    iterations = _work_factor('iterations')
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    time_cost = _work_factor('time_cost')
+    memory_cost = _work_factor('memory_cost')
+    parallelism = _work_factor('parallelism')
+
+class BCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    rounds = _work_factor('rounds')
@@ -0,0 +1,238 @@
+import atexit
+import logging
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import OperationalError, close_old_connections, transaction
+from django.db.models import F, Max
+from . import cache, notify
+from .models import Article, Comment
+
+# write-behind comment ingestion, on when BLOG_COMMENT_QUEUE_SIZE is set. the
+# comment POST view validates a comment and submit()s it to a bounded queue
+# instead of inserting it, and answers 202, or 503 when the queue is full. a
+# background thread commits queued comments up to BLOG_COMMENT_QUEUE_BATCH
+# per transaction: comments that arrive while it writes wait for the next
+# batch, so a burst takes sqlite's write lock once per batch instead of once
+# per comment.
+#
+# a batch that fails with an OperationalError, such as "database is locked",
+# is retried with backoff for up to MAX_RETRY_TIME seconds while the queue
+# fills up behind it. one that fails with anything else, or is still failing
+# then, is written a comment at a time, dropping only the comments the
+# database refuses. comments whose article or author is deleted while they
+# wait are dropped too, every drop is logged. the queue is in memory. when
+# the process exits normally it waits up to EXIT_TIMEOUT seconds for the
+# queue to drain, a killed process loses what was still queued
+#
+# each accepted comment gets a receipt, '<queue id>-<n>' for the nth comment
+# submitted to its queue, that resolve() turns into the comment's id once it
+# is written. after each batch the writer files the ids under the receipts in
+# the 'receipts' cache, which every worker process shares, RECEIPT_BLOCK
+# comments per entry, along with the last n it has dealt with, so that any
+# process can tell a receipt that is still queued from one that was dropped
+
+logger = logging.getLogger(__name__)
+
+# seconds between retries of a batch, doubling up to the max, and the
+# longest a batch is retried for
+RETRY_DELAY = 0.1
+MAX_RETRY_DELAY = 5
+MAX_RETRY_TIME = 30
+
+# the longest an exiting process waits for its queue to be written
+EXIT_TIMEOUT = 60
+
+# receipts filed per cache entry
+RECEIPT_BLOCK = 1000
+
+# what resolve() returns for a comment that is still queued
+QUEUED = object()
+
+def _receipts():
+    return caches['receipts']
+
+class CommentQueue:
+    def __init__(self, size):
+        self.queue = queue.Queue(size)
+        self.id = uuid.uuid4().hex
+        self.submitted = 0
+        self.lock = threading.Lock()
+        # the last n dealt with, kept for as long as the cache has room. the
+        # blocks of receipts expire
+        _receipts().set(self.id, -1, None)
+
+    def submit(self, aid, uid, content):
+        # queue a comment, returns its receipt, or None if full. comments
+        # are queued in the order of their n
+        with self.lock:
+            try:
+                self.queue.put_nowait((self.submitted, aid, uid, content))
+            except queue.Full:
+                return None
+            self.submitted += 1
+            return f'{self.id}-{self.submitted - 1}'
+
+    def flush(self, timeout=None):
+        # wait until every comment queued so far is committed or dropped, or
+        # timeout seconds pass. returns False on timeout
+        with self.queue.all_tasks_done:
+            return self.queue.all_tasks_done.wait_for(lambda: not self.queue.unfinished_tasks, timeout)
+
+    def stop(self):
+        # make run() return once the comments queued so far are written
+        self.queue.put(None)
+
+    def run(self):
+        # the writer loop, for a background thread
+        stopped = False
+        while not stopped:
+            batch = []
+            while len(batch) < settings.BLOG_COMMENT_QUEUE_BATCH:
+                try:
+                    # wait for the first comment only
+                    item = self.queue.get(block=not batch)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.task_done()
+                    stopped = True
+                    break
+                batch.append(item)
+
+            try:
+                if batch:
+                    written = self.commit(batch)
+                    announce({aid for n, aid, _, _ in batch if n in written})
+                    self.file(batch, written)
+            except Exception:
+                # written, but caches may serve the old lists until they
+                # expire, and receipts may not resolve
+                logger.exception('failed to announce %d written comments', len(batch))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def commit(self, batch, deadline=None):
+        # write() the batch, retrying and splitting it as needed, returns
+        # {n: comment id} for the comments written. retries stop at deadline,
+        # MAX_RETRY_TIME from the first attempt
+        if deadline is None:
+            deadline = time.monotonic() + MAX_RETRY_TIME
+        delay = RETRY_DELAY
+        while True:
+            try:
+                ids = write([item[1:] for item in batch])
+                return {n: cid for (n, _, _, _), cid in zip(batch, ids) if cid is not None}
+            except Exception as error:
+                if isinstance(error, OperationalError) and time.monotonic() + delay < deadline:
+                    logger.warning('retrying %d queued comments in %gs', len(batch), delay, exc_info=True)
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
+                    continue
+                if len(batch) == 1:
+                    logger.exception('dropped a queued comment')
+                    return {}
+                # find the comments at fault, write the rest
+                written = {}
+                for item in batch:
+                    written.update(self.commit([item], deadline))
+                return written
+            finally:
+                # like the end of a request, don't hold on to a broken or
+                # expired connection
+                close_old_connections()
+
+    def file(self, batch, written):
+        # file the ids of the batch's written comments under their receipts,
+        # and None for the dropped ones. only this queue's writer writes its
+        # entries
+        receipts = _receipts()
+        blocks = {}
+        for n, _, _, _ in batch:
+            blocks.setdefault(n // RECEIPT_BLOCK, {})[n] = written.get(n)
+        for block, ids in blocks.items():
+            key = f'{self.id}:{block}'
+            receipts.set(key, {**receipts.get(key, {}), **ids})
+        receipts.set(self.id, batch[-1][0], None)
+
+def resolve(receipt):
+    # the id of the comment a receipt was given for once it is written,
+    # QUEUED until then, None if it was dropped or the receipt is unknown
+    queue_id, _, n = receipt.partition('-')
+    if not re.fullmatch('[0-9a-f]{32}', queue_id) or not n.isdigit():
+        return None
+    n = int(n)
+    receipts = _receipts()
+    last = receipts.get(queue_id)
+    if last is None:
+        return None
+    if n > last:
+        return QUEUED
+    return receipts.get(f'{queue_id}:{n // RECEIPT_BLOCK}', {}).get(n)
+
+def write(batch):
+    # commit (aid, uid, content) comments in one transaction, returns the id
+    # of each comment, or None for those whose article or author is gone
+    with transaction.atomic():
+        aids = set(Article.objects.filter(id__in={aid for aid, _, _ in batch}).values_list('id', flat=True))
+        uids = set(User.objects.filter(id__in={uid for _, uid, _ in batch}).values_list('id', flat=True))
+        comments = [Comment(article_id=aid, author_id=uid, content=content) if aid in aids and uid in uids else None
+                for aid, uid, content in batch]
+        written = [comment for comment in comments if comment is not None]
+        Comment.objects.bulk_create(written)
+        if written and written[-1].id is None:
+            # sqlite doesn't report the ids of bulk inserts. the transaction
+            # has held the write lock since the first insert, so the
+            # comments have the newest ids, in order
+            last = Comment.objects.aggregate(Max('id'))['id__max']
+            for cid, comment in enumerate(written, last - len(written) + 1):
+                comment.id = cid
+
+        counts = Counter(comment.article_id for comment in written)
+        for aid, count in counts.items():
+            Article.objects.filter(id=aid).update(comment_count=F('comment_count') + count, version=F('version') + 1)
+
+    if len(written) < len(batch):
+        logger.info('dropped %d queued comments on deleted articles or users', len(batch) - len(written))
+    return [comment.id if comment else None for comment in comments]
+
+def announce(aids):
+    # after comments on these articles are written, invalidate their cache
+    # names and wake long polls waiting on them
+    if aids:
+        cache.invalidate('articles', *[name for aid in aids for name in (f'article:{aid}', f'article:{aid}:comments')])
+    for aid in aids:
+        notify.notify(aid)
+
+_lock = threading.Lock()
+_queue = None
+
+def _get_queue():
+    # the process's queue, with its writer thread started on first use
+    global _queue
+    with _lock:
+        if _queue is None:
+            _queue = CommentQueue(settings.BLOG_COMMENT_QUEUE_SIZE)
+            threading.Thread(target=_queue.run, name='blog-comment-writer', daemon=True).start()
+            # atexit runs before daemon threads are stopped
+            atexit.register(_flush_at_exit)
+    return _queue
+
+def _flush_at_exit():
+    if not _queue.flush(EXIT_TIMEOUT):
+        logger.error('exiting with %d queued comments unwritten', _queue.queue.unfinished_tasks)
+
+def submit(aid, uid, content):
+    return _get_queue().submit(aid, uid, content)
+
+def flush(timeout=None):
+    # wait for the process's queue to drain, False if timeout seconds pass
+    # first
+    return _queue is None or _queue.flush(timeout)
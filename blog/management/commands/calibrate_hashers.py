@@ -0,0 +1,84 @@
+import math
+import time
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+
+# how each work factor scales the time to hash: linearly, or as a power of 2.
+# argon2's memory_cost and parallelism are left alone, they trade memory and
+# cores rather than time
+SCALING = {
+    'iterations': 'linear',
+    'time_cost': 'linear',
+    'rounds': 'log2',
+}
+
+def release_default(hasher, name):
+    # the work factor django's own hasher uses in this release, the floor for
+    # any suggestion: users re-hashed below it would be weaker than stock
+    for cls in type(hasher).__mro__:
+        value = cls.__dict__.get(name)
+        if isinstance(value, int):
+            return value
+    return None
+
+class Command(BaseCommand):
+    help = 'Time the configured password hashers on this host and suggest BLOG_PASSWORD_WORK_FACTORS for a target latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=100, help='time to hash one password')
+        parser.add_argument('--runs', type=int, default=5, help='hashes timed per hasher, the fastest counts')
+
+    def time_hash(self, hasher, runs):
+        salt = hasher.salt()
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            hasher.encode('calibrate', salt)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def handle(self, *args, **options):
+        target = options['target_ms'] / 1000
+        suggested = {}
+
+        for hasher in get_hashers():
+            factors = settings.BLOG_PASSWORD_WORK_FACTORS.get(hasher.algorithm)
+            if factors is None:
+                continue
+            try:
+                if hasher.library is not None:
+                    hasher._load_library()
+            except ValueError:
+                # optional library, argon2-cffi or bcrypt
+                self.stdout.write(f'{hasher.algorithm}: library not installed, skipped')
+                suggested[hasher.algorithm] = factors
+                continue
+
+            elapsed = self.time_hash(hasher, options['runs'])
+            suggested[hasher.algorithm] = dict(factors)
+            for name, scaling in SCALING.items():
+                if name not in factors:
+                    continue
+                if scaling == 'linear':
+                    value = factors[name] * target / elapsed
+                    # round to 2 significant digits, a cleaner setting
+                    digits = max(0, int(math.log10(value)) - 1)
+                    value = max(1, round(value, -digits))
+                else:
+                    value = max(4, factors[name] + round(math.log2(target / elapsed)))
+
+                floor = release_default(hasher, name)
+                if floor is not None and value < floor:
+                    self.stderr.write(f'{hasher.algorithm}: {name} {int(value)} would meet the target, '
+                            f"but is below django's default of {floor}, suggesting {floor}")
+                    value = floor
+                suggested[hasher.algorithm][name] = int(value)
+            self.stdout.write(f'{hasher.algorithm}: {elapsed * 1000:.1f} ms with {factors}, '
+                    f'suggest {suggested[hasher.algorithm]}')
+
+        self.stdout.write('')
+        self.stdout.write('BLOG_PASSWORD_WORK_FACTORS = {')
+        for algorithm, factors in suggested.items():
+            self.stdout.write(f'    {algorithm!r}: {factors!r},')
+        self.stdout.write('}')
@@ -0,0 +1,77 @@
+import datetime
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from blog.models import Article, Comment
+
+# exported in this order, so that every row's foreign keys point back to rows
+# already imported. rows are flat objects of the model's concrete columns,
+# foreign keys as <field>_id, plus the model name. group and permission
+# memberships of users are not exported
+MODELS = [
+    ('user', User),
+    ('article', Article),
+    ('comment', Comment),
+]
+
+class Encoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes down to milliseconds, keep them exact
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+def columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+class Progress:
+    # rows per second reports on stderr, about every interval seconds
+
+    def __init__(self, stream, verb, interval=1):
+        self.stream = stream
+        self.verb = verb
+        self.interval = interval
+
+    def start(self, name):
+        self.name = name
+        self.rows = 0
+        self.started = self.reported = time.perf_counter()
+
+    def add(self, rows=1):
+        self.rows += rows
+        now = time.perf_counter()
+        if now - self.reported >= self.interval:
+            self.report(now)
+
+    def report(self, now=None):
+        now = now or time.perf_counter()
+        self.reported = now
+        elapsed = max(now - self.started, 1e-9)
+        self.stream.write(f'{self.verb} {self.rows} {self.name} rows, {self.rows / elapsed:.0f} rows/s')
+
+class Command(BaseCommand):
+    help = 'Stream users, articles and comments out as NDJSON, one row per line, for import_blog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='file to write, stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        output = open(options['output'], 'w') if options['output'] else self.stdout
+        # progress goes to stderr, stdout may be the export itself
+        progress = Progress(self.stderr, 'exported')
+        encoder = Encoder()
+
+        try:
+            for name, model in MODELS:
+                progress.start(name)
+                rows = model.objects.order_by('id').values(*columns(model)).iterator(chunk_size=options['chunk_size'])
+                for row in rows:
+                    row['model'] = name
+                    output.write(encoder.encode(row) + '\n')
+                    progress.add()
+                progress.report()
+        finally:
+            if output is not self.stdout:
+                output.close()
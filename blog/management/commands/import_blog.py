@@ -0,0 +1,74 @@
+import json
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from .export_blog import MODELS, Progress
+
+class Command(BaseCommand):
+    help = ('Load NDJSON from export_blog into an empty database, keeping ids. Rows are inserted '
+            'in batches, one transaction each, so an interrupted import can be resumed with --resume')
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='file to read, - for stdin')
+        parser.add_argument('--batch-size', type=int, default=1000, help='rows per insert and transaction')
+        parser.add_argument('--resume', action='store_true',
+                help='skip the rows already imported by an interrupted run into this database')
+
+    def handle(self, *args, **options):
+        models = dict(MODELS)
+        # exports are in id order per model and batches commit in that order,
+        # so an interrupted import left exactly the rows up to the max id
+        imported = {name: model.objects.aggregate(Max('id'))['id__max'] or 0 for name, model in MODELS}
+        if not options['resume'] and any(imported.values()):
+            raise CommandError('the database already has users, articles or comments, '
+                    'use --resume to continue an interrupted import')
+
+        progress = Progress(self.stderr, 'imported')
+        batch_size = options['batch_size']
+        batch = []
+        current = None
+
+        def flush():
+            if batch:
+                with transaction.atomic():
+                    models[current].objects.bulk_create(batch)
+                progress.add(len(batch))
+                batch.clear()
+
+        source = sys.stdin if options['input'] == '-' else open(options['input'])
+        try:
+            for number, line in enumerate(source, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    name = row.pop('model')
+                    model = models[name]
+                except (ValueError, KeyError):
+                    raise CommandError(f'line {number}: not an export_blog row')
+
+                if name != current:
+                    flush()
+                    if current is not None:
+                        progress.report()
+                    current = name
+                    progress.start(name)
+                if row['id'] <= imported[name]:
+                    continue
+                batch.append(model(**row))
+                if len(batch) >= batch_size:
+                    flush()
+            flush()
+            if current is not None:
+                progress.report()
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        # new rows must not reuse the imported ids, on databases that keep
+        # sequences apart from the tables
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), list(models.values())):
+                cursor.execute(sql)
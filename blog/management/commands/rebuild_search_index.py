@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from blog import search
+
+class Command(BaseCommand):
+    help = 'Recreate the article full-text search index and its triggers, and reindex every article'
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            search.install(cursor)
+        self.stdout.write('search index rebuilt')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from blog import cache
+from blog.models import Article, Comment
+
+class Command(BaseCommand):
+    help = 'Recompute Article.comment_count from the comment table, repairing any drift'
+
+    def handle(self, *args, **options):
+        counts = Comment.objects.filter(article=OuterRef('pk')).order_by().values('article').annotate(count=Count('id')).values('count')
+        actual = Coalesce(Subquery(counts), 0)
+
+        with transaction.atomic():
+            drifted = list(Article.objects.annotate(actual=actual).exclude(comment_count=F('actual')).values_list('id', flat=True))
+            Article.objects.filter(id__in=drifted).update(comment_count=actual, version=F('version') + 1)
+
+        cache.invalidate('articles', *[f'article:{aid}' for aid in drifted])
+        self.stdout.write(f'repaired {len(drifted)} article(s)')
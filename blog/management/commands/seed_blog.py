@@ -0,0 +1,64 @@
+import random
+from collections import Counter
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from blog.models import Article, Comment
+
+WORDS = [
+    'alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel',
+    'india', 'juliett', 'kilo', 'lima', 'mike', 'november', 'oscar', 'papa',
+    'quebec', 'romeo', 'sierra', 'tango', 'uniform', 'victor', 'whiskey',
+    'xray', 'yankee', 'zulu',
+]
+
+class Command(BaseCommand):
+    help = ('Bulk-create users, articles and comments for benchmarking. The same arguments always '
+            'produce the same data: article authors are uniform, comments follow a Zipf-like '
+            'distribution over articles so a few threads are very long')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--articles', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--password', default='password',
+                help='password of every seeded user, named seed-user-<n>')
+        parser.add_argument('--batch-size', type=int, default=1000, help='comments built in memory at a time')
+
+    def text(self, rng, words):
+        return ' '.join(rng.choices(WORDS, k=words))
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            # hashing once and sharing the hash keeps seeding fast
+            password = make_password(options['password'])
+            users = [User(username=f'seed-user-{n}', password=password) for n in range(options['users'])]
+            # django picks insert batch sizes within the database's limits
+            User.objects.bulk_create(users)
+            user_ids = list(User.objects.filter(username__startswith='seed-user-').order_by('id').values_list('id', flat=True))
+
+            last_article = Article.objects.aggregate(Max('id'))['id__max'] or 0
+            articles = [Article(title=self.text(rng, 4), content=self.text(rng, 50), author_id=rng.choice(user_ids))
+                    for _ in range(options['articles'])]
+            Article.objects.bulk_create(articles)
+            article_ids = list(Article.objects.filter(id__gt=last_article).order_by('id').values_list('id', flat=True))
+
+            # the n-th article gets comments in proportion to 1/n
+            weights = [1 / (n + 1) for n in range(len(article_ids))]
+            commented = rng.choices(article_ids, weights, k=options['comments']) if article_ids else []
+            for start in range(0, len(commented), batch_size):
+                Comment.objects.bulk_create([
+                    Comment(article_id=aid, content=self.text(rng, 20), author_id=rng.choice(user_ids))
+                    for aid in commented[start:start + batch_size]
+                ])
+
+            for aid, count in Counter(commented).items():
+                Article.objects.filter(id=aid).update(comment_count=count)
+
+        self.stdout.write(f'seeded {len(users)} users, {len(articles)} articles, {len(commented)} comments')
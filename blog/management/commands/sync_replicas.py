@@ -0,0 +1,32 @@
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+class Command(BaseCommand):
+    help = 'Copy the primary sqlite database onto its read replicas, see blog/routers.py'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='replicas to refresh, all of BLOG_REPLICAS by default')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.BLOG_REPLICAS
+        if not aliases:
+            raise CommandError('no replicas, set BLOG_REPLICAS or name them')
+
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('only sqlite replicas are supported, use the database\'s own replication')
+        primary.ensure_connection()
+
+        for alias in aliases:
+            if alias not in settings.DATABASES or alias == 'default':
+                raise CommandError(f'{alias} is not a replica database')
+            # sqlite's online backup API, a consistent snapshot of the
+            # primary even while it is being written to
+            replica = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+            try:
+                primary.connection.backup(replica)
+            finally:
+                replica.close()
+            self.stdout.write(f'synced {alias}')
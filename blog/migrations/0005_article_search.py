@@ -0,0 +1,52 @@
+from django.db import migrations
+
+# a copy of blog.search's SQL as of this migration, so that later changes to
+# that module can't change what this migration does
+
+INSTALL_SQL = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS blog_article_fts
+        USING fts5(title, content, content='blog_article', content_rowid='id')''',
+    '''CREATE TRIGGER IF NOT EXISTS blog_article_fts_insert AFTER INSERT ON blog_article BEGIN
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS blog_article_fts_delete AFTER DELETE ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS blog_article_fts_update AFTER UPDATE OF title, content ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END''',
+    "INSERT INTO blog_article_fts(blog_article_fts) VALUES ('rebuild')",
+]
+
+UNINSTALL_SQL = [
+    'DROP TRIGGER IF EXISTS blog_article_fts_insert',
+    'DROP TRIGGER IF EXISTS blog_article_fts_delete',
+    'DROP TRIGGER IF EXISTS blog_article_fts_update',
+    'DROP TABLE IF EXISTS blog_article_fts',
+]
+
+
+def install(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in INSTALL_SQL:
+            schema_editor.execute(sql)
+
+
+def uninstall(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in UNINSTALL_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_comment_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -5,8 +5,16 @@ class Article(models.Model):
     title = models.CharField(max_length=64)
     content = models.TextField()
     author = models.ForeignKey(User, on_delete=models.CASCADE)
+    # bumped on every edit, used for ETags
+    version = models.PositiveIntegerField(default=1)
+    # maintained by the comment views and blog.signals, see recount_comments
+    comment_count = models.PositiveIntegerField(default=0)
 
 class Comment(models.Model):
+    # comment lists are read in id order, per article or per author. sqlite's
+    # foreign key indexes end in the rowid, so they serve those reads as is
     article = models.ForeignKey(Article, on_delete=models.CASCADE)
     content = models.TextField()
     author = models.ForeignKey(User, on_delete=models.CASCADE)
+    # bumped on every edit, used for ETags
+    version = models.PositiveIntegerField(default=1)
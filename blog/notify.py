@@ -0,0 +1,53 @@
+import threading
+
+# in-process wakeups for long-polling comment lists. a waiting request
+# registers with watch(aid) before it reads the list, so a comment written
+# between its read and its wait still wakes it. writers call notify(aid)
+# once their comments are committed. only articles with watchers have an
+# entry, and waiting holds no database connection busy or CPU, only the
+# request's thread.
+#
+# requests served by other processes aren't woken. they read the list again
+# when their wait times out, and as the blog cache's generation tokens are
+# shared by all processes (see cache.py) they see the new comments then
+
+_lock = threading.Lock()
+_entries = {}
+
+class _Entry:
+    def __init__(self):
+        self.condition = threading.Condition(_lock)
+        self.generation = 0
+        self.watchers = 0
+
+class Watcher:
+    def __init__(self, aid):
+        self.aid = aid
+
+    def __enter__(self):
+        with _lock:
+            self.entry = _entries.setdefault(self.aid, _Entry())
+            self.entry.watchers += 1
+            self.seen = self.entry.generation
+        return self
+
+    def __exit__(self, *exc_info):
+        with _lock:
+            self.entry.watchers -= 1
+            if not self.entry.watchers:
+                del _entries[self.aid]
+
+    def wait(self, timeout):
+        # True once notify(aid) was called since entering, False on timeout
+        with _lock:
+            return self.entry.condition.wait_for(lambda: self.entry.generation != self.seen, timeout)
+
+def watch(aid):
+    return Watcher(aid)
+
+def notify(aid):
+    with _lock:
+        entry = _entries.get(aid)
+        if entry is not None:
+            entry.generation += 1
+            entry.condition.notify_all()
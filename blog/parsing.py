@@ -0,0 +1,60 @@
+import json
+from django.conf import settings
+from django.http import HttpResponse
+
+# the one place JSON request bodies are read. parse() turns away oversized
+# bodies by their Content-Length before reading anything, bodies not sent as
+# application/json before decoding them, and missing, mistyped or overlong
+# fields before the view does any database work.
+#
+# a schema maps each expected field to its max length, None for no limit.
+# all fields in this API are strings, and other keys are ignored
+
+class ParseError(Exception):
+    def __init__(self, status=400):
+        super().__init__(status)
+        self.status = status
+
+    def response(self):
+        return HttpResponse(status=self.status)
+
+def fields(model, *names):
+    # a schema for the given model fields, limited as in the model
+    return {name: model._meta.get_field(name).max_length for name in names}
+
+def _check(item, schema):
+    if not isinstance(item, dict):
+        raise ParseError()
+    for name, max_length in schema.items():
+        value = item.get(name)
+        if not isinstance(value, str) or (max_length is not None and len(value) > max_length):
+            raise ParseError()
+    return item
+
+def parse(request, schema, max_size, many=False):
+    # the request body, one JSON object matching schema or, with many, also
+    # a list of 1 to BLOG_BULK_MAX_ITEMS of them. raises ParseError, with
+    # 413 for bodies over max_size bytes and 400 for anything else
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        raise ParseError()
+    if length > max_size:
+        raise ParseError(413)
+    if request.content_type != 'application/json':
+        raise ParseError()
+
+    # never more than max_size, whatever the header said
+    body = request.read(max_size + 1)
+    if len(body) > max_size:
+        raise ParseError(413)
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise ParseError()
+
+    if many and isinstance(data, list):
+        if not 0 < len(data) <= settings.BLOG_BULK_MAX_ITEMS:
+            raise ParseError()
+        return [_check(item, schema) for item in data]
+    return _check(data, schema)
@@ -0,0 +1,67 @@
+import functools
+import random
+import threading
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+# read replicas. views wrapped in replica_reads() run the queries of their GET
+# requests against one of BLOG_REPLICAS, everything else stays on 'default',
+# the primary. replicas are copies of the primary made by the sync_replicas
+# command, so they lag behind it: after any write a client is pinned to the
+# primary for BLOG_REPLICA_PIN_SECONDS by a cookie, to always see its own
+# changes
+
+PIN_COOKIE = 'blog_primary'
+
+_local = threading.local()
+
+def replica():
+    # the replica the current request reads from, None for the primary
+    return getattr(_local, 'alias', None)
+
+def replica_reads(view):
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD') or not settings.BLOG_REPLICAS
+                or PIN_COOKIE in request.COOKIES):
+            return view(request, *args, **kwargs)
+
+        # who the user is always comes from the primary, a lagging replica
+        # could still have a session that was just signed out
+        request.user.is_authenticated
+        _local.alias = random.choice(settings.BLOG_REPLICAS)
+        try:
+            # streamed responses are read after this, from the primary
+            return view(request, *args, **kwargs)
+        finally:
+            _local.alias = None
+    return wrapper
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return replica()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get the primary's schema along with its data
+        return db not in settings.BLOG_REPLICAS
+
+class PinPrimaryMiddleware:
+    # sets the pin cookie on the response to any successful write
+
+    def __init__(self, get_response):
+        if not settings.BLOG_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.BLOG_REPLICA_PIN_SECONDS, httponly=True)
+        return response
@@ -0,0 +1,57 @@
+from django.db import connection
+
+# full-text search over article titles and contents, with an sqlite FTS5
+# table that indexes blog_article as its external content. triggers keep it in
+# step with every write, including bulk inserts and queryset updates/deletes.
+#
+# sqlite drops triggers when django rebuilds a table during a migration, so
+# run the rebuild_search_index command after any migration that alters
+# blog_article. migration 0005 installs its own copy of this SQL, changes
+# here need a migration of their own
+
+INSTALL_SQL = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS blog_article_fts
+        USING fts5(title, content, content='blog_article', content_rowid='id')''',
+    '''CREATE TRIGGER IF NOT EXISTS blog_article_fts_insert AFTER INSERT ON blog_article BEGIN
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS blog_article_fts_delete AFTER DELETE ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS blog_article_fts_update AFTER UPDATE OF title, content ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END''',
+]
+
+UNINSTALL_SQL = [
+    'DROP TRIGGER IF EXISTS blog_article_fts_insert',
+    'DROP TRIGGER IF EXISTS blog_article_fts_delete',
+    'DROP TRIGGER IF EXISTS blog_article_fts_update',
+    'DROP TABLE IF EXISTS blog_article_fts',
+]
+
+def install(cursor):
+    # create the index and its triggers if missing, then reindex everything
+    for sql in INSTALL_SQL:
+        cursor.execute(sql)
+    cursor.execute("INSERT INTO blog_article_fts(blog_article_fts) VALUES ('rebuild')")
+
+def uninstall(cursor):
+    for sql in UNINSTALL_SQL:
+        cursor.execute(sql)
+
+def match_query(text):
+    # treat every word as a literal term, so user input can't hit FTS5 query
+    # syntax (operators, column filters, unbalanced quotes)
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+
+def search(text, offset, limit):
+    # ids of matching articles, best BM25 rank first
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT rowid FROM blog_article_fts WHERE blog_article_fts MATCH %s ORDER BY rank LIMIT %s OFFSET %s',
+            [match_query(text), limit, offset])
+        return [row[0] for row in cursor.fetchall()]
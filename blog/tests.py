@@ -1,8 +1,56 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.contrib.auth import get_user
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.core import signing
+from io import StringIO
+from django.db import OperationalError, connection
+from django.db.models.signals import post_delete
+from django.test.utils import CaptureQueriesContext
+import hashlib
 import json
-
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+from . import auth, cache, ingest, notify, search, views
+from .deletion import delete_user
+from .models import Article, Comment
+
+# the on-disk caches get a directory of their own, so that running the tests
+# leaves a local server's sessions and rate limit buckets alone
+_cache_dir = tempfile.TemporaryDirectory()
+TEST_CACHES = {
+    alias: dict(config, LOCATION=os.path.join(_cache_dir.name, alias))
+    if config['BACKEND'].endswith('.FileBasedCache') else config
+    for alias, config in settings.CACHES.items()
+}
+
+def other_process(code, *args):
+    # run code in a new python process set up like this one, as another
+    # worker of the same server would be, returns what it prints
+    process = subprocess.run([sys.executable, '-c',
+            'import json, sys, django; from django.conf import settings; '
+            'settings.CACHES = json.loads(sys.argv[1]); django.setup(); ' + code,
+            json.dumps(settings.CACHES), *args],
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='myblog.settings'),
+            cwd=settings.BASE_DIR, stdout=subprocess.PIPE, check=True)
+    return process.stdout.decode().strip()
+
+@override_settings(CACHES=TEST_CACHES)
 class BlogTestCase(TestCase):
+    def setUp(self):
+        # caches outlive the per-test database rollback
+        for cache in caches.all():
+            cache.clear()
+
     def test_csrf(self):
         client = Client(enforce_csrf_checks=True)
 
@@ -393,3 +441,1503 @@ class BlogTestCase(TestCase):
 
         self.assertEqual(len(response.json()), 1)
         self.assertEqual(response.json()[0], comment1)
+
+    def test_pagination(self):
+        client = Client()
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # test articles
+        articles = []
+        for i in range(5):
+            response = client.post('/api/article/', {'title': f'title{i}', 'content': 'content'},
+                    content_type='application/json')
+            articles.append(response.json())
+
+        # bad parameters
+        response = client.get('/api/article/', {'limit': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+        response = client.get('/api/article/', {'limit': 0})
+        self.assertEqual(response.status_code, 400)
+        response = client.get('/api/article/', {'after': -1})
+        self.assertEqual(response.status_code, 400)
+
+        # first page
+        response = client.get('/api/article/', {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), articles[:2])
+        cursor = response['X-Next-Cursor']
+
+        # follow the cursor to the end
+        response = client.get('/api/article/', {'limit': 2, 'after': cursor})
+        self.assertEqual(response.json(), articles[2:4])
+        cursor = response['X-Next-Cursor']
+
+        response = client.get('/api/article/', {'limit': 2, 'after': cursor})
+        self.assertEqual(response.json(), articles[4:])
+        self.assertFalse(response.has_header('X-Next-Cursor'))
+
+        # test comments
+        comments = []
+        for i in range(3):
+            response = client.post(f'/api/article/{articles[0]["id"]}/comment/', {'content': f'content{i}'},
+                    content_type='application/json')
+            comments.append(response.json())
+
+        response = client.get(f'/api/article/{articles[0]["id"]}/comment/', {'limit': 2})
+        self.assertEqual(response.json(), comments[:2])
+        cursor = response['X-Next-Cursor']
+
+        response = client.get(f'/api/article/{articles[0]["id"]}/comment/', {'limit': 2, 'after': cursor})
+        self.assertEqual(response.json(), comments[2:])
+        self.assertFalse(response.has_header('X-Next-Cursor'))
+
+    def test_stream(self):
+        client = Client()
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # empty list
+        response = client.get('/api/article/', {'stream': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+
+        # only 1 streams
+        response = client.get('/api/article/', {'stream': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+        response = client.get('/api/article/', {'stream': 'false'})
+        self.assertEqual(response.status_code, 400)
+
+        # test articles, more than one chunk
+        articles = []
+        with self.settings(BLOG_STREAM_CHUNK_SIZE=2):
+            for i in range(5):
+                response = client.post('/api/article/', {'title': f'title{i}', 'content': 'content'},
+                        content_type='application/json')
+                articles.append(response.json())
+
+            response = client.get('/api/article/', {'stream': 1})
+            self.assertEqual(json.loads(b''.join(response.streaming_content)), articles)
+
+            # test comments
+            comments = []
+            for i in range(3):
+                response = client.post(f'/api/article/{articles[0]["id"]}/comment/', {'content': f'content{i}'},
+                        content_type='application/json')
+                comments.append(response.json())
+
+            response = client.get(f'/api/article/{articles[0]["id"]}/comment/', {'stream': 1})
+            self.assertEqual(json.loads(b''.join(response.streaming_content)), comments)
+            response = client.get(f'/api/article/{articles[0]["id"]}/comment/', {'stream': 0})
+            self.assertFalse(response.streaming)
+            response = client.get(f'/api/article/{articles[0]["id"]}/comment/', {'stream': 'false'})
+            self.assertEqual(response.status_code, 400)
+
+    def test_fields(self):
+        client = Client()
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # test article
+        response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                content_type='application/json')
+        article = response.json()
+
+        # test comment
+        response = client.post(f'/api/article/{article["id"]}/comment/', {'content': 'content'},
+                content_type='application/json')
+        comment = response.json()
+
+        # unknown field
+        response = client.get('/api/article/', {'fields': 'id,invalid'})
+        self.assertEqual(response.status_code, 400)
+        response = client.get(f'/api/article/{article["id"]}/', {'fields': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+
+        # list, id is always included
+        response = client.get('/api/article/', {'fields': 'title,author'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'id': article['id'], 'title': 'title', 'author': article['author']}])
+
+        # detail
+        response = client.get(f'/api/article/{article["id"]}/', {'fields': 'title'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'id': article['id'], 'title': 'title'})
+
+        # comment list and detail
+        response = client.get(f'/api/article/{article["id"]}/comment/', {'fields': 'author'})
+        self.assertEqual(response.json(), [{'id': comment['id'], 'author': comment['author']}])
+        response = client.get(f'/api/comment/{comment["id"]}/', {'fields': 'article'})
+        self.assertEqual(response.json(), {'id': comment['id'], 'article': article['id']})
+
+        # content is not read from the database unless asked for
+        with CaptureQueriesContext(connection) as queries:
+            client.get('/api/article/', {'fields': 'title'})
+        self.assertFalse(any('"content"' in query['sql'] for query in queries))
+
+    def test_etag(self):
+        client = Client()
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # test article
+        response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                content_type='application/json')
+        article = response.json()
+
+        # test comment
+        response = client.post(f'/api/article/{article["id"]}/comment/', {'content': 'content'},
+                content_type='application/json')
+        comment = response.json()
+
+        urls = [
+            '/api/article/',
+            f'/api/article/{article["id"]}/',
+            f'/api/article/{article["id"]}/comment/',
+            f'/api/comment/{comment["id"]}/',
+        ]
+        etags = {}
+        for url in urls:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etags[url] = response['ETag']
+
+            # unchanged
+            response = client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 304)
+
+        # edits change the etag
+        response = client.put(f'/api/article/{article["id"]}/', {'title': 'title2', 'content': 'content2'},
+                content_type='application/json')
+        response = client.put(f'/api/comment/{comment["id"]}/', {'content': 'content2'},
+                content_type='application/json')
+
+        for url in urls:
+            response = client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etags[url])
+            etags[url] = response['ETag']
+
+        # new comments change the comment list etag, and through the
+        # article's comment_count the article list etag
+        response = client.post(f'/api/article/{article["id"]}/comment/', {'content': 'content'},
+                content_type='application/json')
+        for url in [urls[0], urls[2]]:
+            response = client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200)
+            etags[url] = response['ETag']
+
+        # the article list stamp is only computed once per change
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(urls[0], HTTP_IF_NONE_MATCH=etags[urls[0]])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in queries if 'COUNT' in query['sql']])
+
+        # new and deleted articles change the article list etag
+        response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                content_type='application/json')
+        response = client.get(urls[0], HTTP_IF_NONE_MATCH=etags[urls[0]])
+        self.assertEqual(response.status_code, 200)
+        etags[urls[0]] = response['ETag']
+        client.delete(f'/api/article/{response.json()[-1]["id"]}/')
+        response = client.get(urls[0], HTTP_IF_NONE_MATCH=etags[urls[0]])
+        self.assertEqual(response.status_code, 200)
+        etags[urls[0]] = response['ETag']
+
+        # so do changes made by another worker process, which can't see the
+        # in-memory test database: the change is made here without
+        # invalidating, and only the invalidation is left to the other one
+        Article.objects.filter(id=article['id']).update(version=100)
+        response = client.get(urls[0], HTTP_IF_NONE_MATCH=etags[urls[0]])
+        self.assertEqual(response.status_code, 304)
+        other_process('from blog import cache; cache.invalidate(sys.argv[2])', 'articles')
+        response = client.get(urls[0], HTTP_IF_NONE_MATCH=etags[urls[0]])
+        self.assertEqual(response.status_code, 200)
+
+        # nonexistent
+        response = client.get('/api/article/0/comment/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cache(self):
+        client = Client()
+
+        # not get
+        response = client.options('/api/cache/stats/')
+        self.assertEqual(response.status_code, 405)
+
+        # not signed in
+        response = client.get('/api/cache/stats/')
+        self.assertEqual(response.status_code, 403)
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # test article
+        response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                content_type='application/json')
+        article = response.json()
+
+        # test comment
+        response = client.post(f'/api/article/{article["id"]}/comment/', {'content': 'content'},
+                content_type='application/json')
+        comment = response.json()
+
+        urls = [
+            f'/api/article/{article["id"]}/',
+            f'/api/article/{article["id"]}/comment/',
+            f'/api/comment/{comment["id"]}/',
+        ]
+
+        # warm up, then repeated reads don't touch the blog tables
+        for url in urls:
+            client.get(url)
+        stats = client.get('/api/cache/stats/').json()
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any('blog_' in query['sql'] for query in queries))
+        self.assertGreater(client.get('/api/cache/stats/').json()['hits'], stats['hits'])
+
+        # writes are visible right away
+        response = client.put(f'/api/article/{article["id"]}/', {'title': 'title2', 'content': 'content2'},
+                content_type='application/json')
+        response = client.get(urls[0])
+        self.assertEqual(response.json()['title'], 'title2')
+
+        response = client.put(f'/api/comment/{comment["id"]}/', {'content': 'content2'},
+                content_type='application/json')
+        response = client.get(urls[1])
+        self.assertEqual(response.json()[0]['content'], 'content2')
+        response = client.get(urls[2])
+        self.assertEqual(response.json()['content'], 'content2')
+
+        response = client.post(f'/api/article/{article["id"]}/comment/', {'content': 'content'},
+                content_type='application/json')
+        response = client.get(urls[1])
+        self.assertEqual(len(response.json()), 2)
+
+        # an invalidation in another worker process reaches the values this
+        # one cached. the other process can't see the in-memory test
+        # database, so the write is made here without invalidating
+        client.get(urls[0])
+        Article.objects.filter(id=article['id']).update(title='title3')
+        self.assertEqual(client.get(urls[0]).json()['title'], 'title2')
+        other_process('from blog import cache; cache.invalidate(sys.argv[2])', f'article:{article["id"]}')
+        self.assertEqual(client.get(urls[0]).json()['title'], 'title3')
+
+        # deleting the article takes its cached comments with it
+        response = client.delete(f'/api/article/{article["id"]}/')
+        for url in urls:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 404)
+
+    def test_session_cache(self):
+        client = Client()
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # authenticated requests read the session from the cache
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/article/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('django_session' in query['sql'] for query in queries))
+
+        # sessions only in the database still work
+        caches['sessions'].clear()
+        response = client.get('/api/article/')
+        self.assertEqual(response.status_code, 200)
+
+        # other worker processes share the cached session, and signing out
+        # in this one ends it there too
+        def cached_elsewhere():
+            key = SessionStore(client.session.session_key).cache_key
+            return other_process('from django.core.cache import caches; '
+                    'print(caches["sessions"].get(sys.argv[2]) is not None)', key) == 'True'
+
+        self.assertTrue(cached_elsewhere())
+        key = client.session.session_key
+        response = client.get('/api/signout/')
+        self.assertEqual(response.status_code, 204)
+        client.cookies[settings.SESSION_COOKIE_NAME] = key
+        self.assertFalse(cached_elsewhere())
+        response = client.get('/api/article/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_bearer(self):
+        client = Client()
+
+        # not post
+        response = client.options('/api/bearer/')
+        self.assertEqual(response.status_code, 405)
+
+        # bad json
+        response = client.post('/api/bearer/', {'invalid': 'payload'})
+        self.assertEqual(response.status_code, 400)
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # incorrect
+        response = client.post('/api/bearer/', {'username': 'user', 'password': 'incorrect'},
+                content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+        # correct password
+        response = client.post('/api/bearer/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        token = response.json()['token']
+
+        # no session or csrf token needed
+        client = Client(enforce_csrf_checks=True, HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/article/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('django_session' in query['sql'] or 'auth_user' in query['sql'] for query in queries))
+
+        # forged
+        response = client.get('/api/article/', HTTP_AUTHORIZATION=f'Bearer {token}x')
+        self.assertEqual(response.status_code, 401)
+
+        # expired
+        with self.settings(BLOG_TOKEN_MAX_AGE=-1):
+            response = client.get('/api/article/')
+        self.assertEqual(response.status_code, 401)
+
+        # revoked by a password change, once the cached user expires
+        user = User.objects.get(username='user')
+        user.set_password('pass2')
+        user.save()
+        caches['default'].clear()
+        response = client.get('/api/article/')
+        self.assertEqual(response.status_code, 401)
+        response = Client().post('/api/bearer/', {'username': 'user', 'password': 'pass2'},
+                content_type='application/json')
+        response = client.get('/api/article/', HTTP_AUTHORIZATION=f'Bearer {response.json()["token"]}')
+        self.assertEqual(response.status_code, 200)
+
+        # tokens of the bare user id, from before the digest, no longer work
+        response = client.get('/api/article/', HTTP_AUTHORIZATION=f'Bearer {signing.dumps(user.id, salt=auth.SALT)}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_bulk_create(self):
+        client = Client()
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # one bad item fails the whole list
+        response = client.post('/api/article/', [{'title': 'title', 'content': 'content'}, {'invalid': 'payload'}],
+                content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = client.post('/api/article/', [{'title': 'title', 'content': 'content'}, 'invalid'],
+                content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.get('/api/article/').json(), [])
+
+        # too many
+        with self.settings(BLOG_BULK_MAX_ITEMS=1):
+            response = client.post('/api/article/', [{'title': 'title', 'content': 'content'}] * 2,
+                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        # too few
+        response = client.post('/api/article/', [], content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        # create articles
+        response = client.post('/api/article/', [{'title': f'title{i}', 'content': 'content'} for i in range(3)],
+                content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        articles = response.json()
+        self.assertEqual([article['title'] for article in articles], ['title0', 'title1', 'title2'])
+        self.assertEqual(client.get('/api/article/').json(), articles)
+
+        # create comments
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(f'/api/article/{articles[0]["id"]}/comment/', [{'content': f'content{i}'} for i in range(50)],
+                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(len(queries), 10)
+        comments = response.json()
+        self.assertEqual(len(comments), 50)
+
+        # an empty list writes nothing, and leaves the article's version alone
+        version = Article.objects.get(id=articles[0]['id']).version
+        response = client.post(f'/api/article/{articles[0]["id"]}/comment/', [], content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Article.objects.get(id=articles[0]['id']).version, version)
+        self.assertEqual(client.get(f'/api/article/{articles[0]["id"]}/comment/').json(), comments)
+
+    def test_comment_count(self):
+        client = Client()
+
+        # create test user1
+        response = client.post('/api/signup/', {'username': 'user1', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in user1
+        response = client.post('/api/signin/', {'username': 'user1', 'password': 'pass'},
+                content_type='application/json')
+
+        # test article
+        response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                content_type='application/json')
+        article = response.json()
+        self.assertEqual(article['comment_count'], 0)
+        url = f'/api/article/{article["id"]}/'
+
+        # single and bulk comments
+        response = client.post(f'{url}comment/', {'content': 'content'},
+                content_type='application/json')
+        comment = response.json()
+        response = client.post(f'{url}comment/', [{'content': 'content'}] * 2,
+                content_type='application/json')
+        self.assertEqual(client.get(url).json()['comment_count'], 3)
+        self.assertEqual(client.get('/api/article/').json()[0]['comment_count'], 3)
+
+        # delete
+        response = client.delete(f'/api/comment/{comment["id"]}/')
+        self.assertEqual(client.get(url).json()['comment_count'], 2)
+
+        client.get('/api/signout/')
+
+        # create test user2
+        response = client.post('/api/signup/', {'username': 'user2', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in user2
+        response = client.post('/api/signin/', {'username': 'user2', 'password': 'pass'},
+                content_type='application/json')
+
+        response = client.post(f'{url}comment/', [{'content': 'content'}] * 2,
+                content_type='application/json')
+        self.assertEqual(client.get(url).json()['comment_count'], 4)
+
+        # deleting user2 cascades to their comments
+        client.get('/api/signout/')
+        User.objects.get(username='user2').delete()
+        # cache invalidation waits for on_commit, which never comes in a TestCase
+        caches['blog'].clear()
+        response = client.post('/api/signin/', {'username': 'user1', 'password': 'pass'},
+                content_type='application/json')
+        self.assertEqual(client.get(url).json()['comment_count'], 2)
+        self.assertEqual(len(client.get(f'{url}comment/').json()), 2)
+
+        # repair
+        Article.objects.update(comment_count=10)
+        out = StringIO()
+        call_command('recount_comments', stdout=out)
+        self.assertIn('repaired 1 article', out.getvalue())
+        self.assertEqual(client.get(url).json()['comment_count'], 2)
+
+    def test_include_comments(self):
+        client = Client()
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # test articles and comments
+        response = client.post('/api/article/', [{'title': 'title', 'content': 'content'}] * 3,
+                content_type='application/json')
+        articles = response.json()
+        comments = {}
+        for article in articles:
+            response = client.post(f'/api/article/{article["id"]}/comment/', [{'content': 'content'}] * 4,
+                    content_type='application/json')
+            comments[article['id']] = response.json()
+            article['comment_count'] = 4
+
+        # bad parameters
+        response = client.get(f'/api/article/{articles[0]["id"]}/', {'include': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+        response = client.get('/api/article/', {'include': 'comments', 'comment_limit': 0})
+        self.assertEqual(response.status_code, 400)
+
+        # detail, all comments by default
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(f'/api/article/{articles[0]["id"]}/', {'include': 'comments'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), dict(articles[0], comments=comments[articles[0]['id']]))
+        self.assertEqual(sum('blog_' in query['sql'] for query in queries), 2)
+
+        # list, limited per article
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/article/', {'include': 'comments', 'comment_limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [dict(article, comments=comments[article['id']][:2]) for article in articles])
+        self.assertEqual(sum('blog_' in query['sql'] for query in queries), 2)
+
+        # a long thread is read up to the limit only, and more articles than
+        # one query can hold take a query more
+        response = client.post(f'/api/article/{articles[1]["id"]}/comment/', [{'content': 'content'}] * 200,
+                content_type='application/json')
+        comments[articles[1]['id']] += response.json()
+        articles[1]['comment_count'] += 200
+        with mock.patch.object(views, 'MAX_COMPOUND_SELECT', 2):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get('/api/article/', {'include': 'comments', 'comment_limit': 5})
+        self.assertEqual(response.json(), [dict(article, comments=comments[article['id']][:5]) for article in articles])
+        self.assertEqual(sum('blog_' in query['sql'] for query in queries), 3)
+        self.assertIn('LIMIT 5', queries[-1]['sql'])
+
+        # nonexistent
+        response = client.get('/api/article/0/', {'include': 'comments'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_query_plans(self):
+        client = Client()
+
+        # record every query the views run, with their parameters
+        queries = []
+        def record(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        with connection.execute_wrapper(record):
+            response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                    content_type='application/json')
+            article = response.json()
+            url = f'/api/article/{article["id"]}/'
+            response = client.post('/api/article/', [{'title': 'title', 'content': 'content'}] * 2,
+                    content_type='application/json')
+            response = client.post(f'{url}comment/', {'content': 'content'},
+                    content_type='application/json')
+            comment = response.json()
+            response = client.post(f'{url}comment/', [{'content': 'content'}] * 2,
+                    content_type='application/json')
+
+            for params in [{}, {'after': 1, 'limit': 1}, {'fields': 'title'}, {'include': 'comments'}]:
+                client.get('/api/article/', params)
+            for params in [{}, {'include': 'comments', 'comment_limit': 1}]:
+                client.get(url, params)
+            for params in [{}, {'after': 1, 'limit': 1}]:
+                client.get(f'{url}comment/', params)
+            b''.join(client.get(f'{url}comment/', {'stream': 1}).streaming_content)
+            client.get(f'/api/comment/{comment["id"]}/')
+
+            response = client.put(url, {'title': 'title2', 'content': 'content2'},
+                    content_type='application/json')
+            response = client.put(f'/api/comment/{comment["id"]}/', {'content': 'content2'},
+                    content_type='application/json')
+            response = client.delete(f'/api/comment/{comment["id"]}/')
+            response = client.delete(url)
+
+        # whole-table reads that can't avoid a scan: the article list etag
+        # aggregate, cached until an article changes, and ?stream=1 dumps of
+        # the article list, which isn't recorded above
+        allowed_scans = [
+            'SELECT COUNT("blog_article"."id") AS "id__count"',
+        ]
+
+        checked = 0
+        for sql, params in queries:
+            if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            if any(sql.startswith(prefix) for prefix in allowed_scans):
+                continue
+
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                self.assertFalse(step.startswith('SCAN') or 'TEMP B-TREE' in step, (sql, plan))
+            checked += 1
+        self.assertGreater(checked, 20)
+
+    def test_sqlite_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            # NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_search(self):
+        client = Client()
+
+        # not get
+        response = client.options('/api/article/search/')
+        self.assertEqual(response.status_code, 405)
+
+        # not signed in
+        response = client.get('/api/article/search/', {'q': 'query'})
+        self.assertEqual(response.status_code, 403)
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # no query
+        response = client.get('/api/article/search/')
+        self.assertEqual(response.status_code, 400)
+        response = client.get('/api/article/search/', {'q': ' '})
+        self.assertEqual(response.status_code, 400)
+
+        # test articles
+        response = client.post('/api/article/', [
+            {'title': 'apple', 'content': 'banana'},
+            {'title': 'apple apple', 'content': 'apple'},
+            {'title': 'cherry', 'content': 'an apple'},
+            {'title': 'cherry', 'content': 'cherry'},
+        ], content_type='application/json')
+        articles = response.json()
+
+        # ranked, best first
+        response = client.get('/api/article/search/', {'q': 'apple', 'fields': 'title'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([article['id'] for article in response.json()][0], articles[1]['id'])
+        self.assertEqual({article['id'] for article in response.json()}, {article['id'] for article in articles[:3]})
+
+        # paginated
+        response = client.get('/api/article/search/', {'q': 'apple', 'limit': 2})
+        self.assertEqual(len(response.json()), 2)
+        response = client.get('/api/article/search/', {'q': 'apple', 'limit': 2, 'after': response['X-Next-Cursor']})
+        self.assertEqual(len(response.json()), 1)
+        self.assertFalse(response.has_header('X-Next-Cursor'))
+
+        # query syntax is taken literally
+        response = client.get('/api/article/search/', {'q': 'title:"apple OR ('})
+        self.assertEqual(response.status_code, 200)
+
+        # edits and deletes are reflected
+        response = client.put(f'/api/article/{articles[3]["id"]}/', {'title': 'apple', 'content': 'cherry'},
+                content_type='application/json')
+        response = client.delete(f'/api/article/{articles[0]["id"]}/')
+        response = client.get('/api/article/search/', {'q': 'apple'})
+        self.assertEqual({article['id'] for article in response.json()}, {article['id'] for article in articles[1:]})
+        response = client.get('/api/article/search/', {'q': 'banana'})
+        self.assertEqual(response.json(), [])
+
+        # articles deleted between the search and reading them are left out
+        with mock.patch.object(search, 'search', return_value=[articles[0]['id'], articles[1]['id']]):
+            response = client.get('/api/article/search/', {'q': 'apple'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([article['id'] for article in response.json()], [articles[1]['id']])
+
+        # rebuild
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        response = client.get('/api/article/search/', {'q': 'apple'})
+        self.assertEqual(len(response.json()), 3)
+
+    def test_seed_blog(self):
+        out = StringIO()
+        call_command('seed_blog', users=5, articles=20, comments=100, seed=1, stdout=out)
+        self.assertIn('seeded 5 users, 20 articles, 100 comments', out.getvalue())
+
+        # comment counts are consistent, and long threads come first
+        out = StringIO()
+        call_command('recount_comments', stdout=out)
+        self.assertIn('repaired 0 article', out.getvalue())
+        counts = list(Article.objects.order_by('id').values_list('comment_count', flat=True))
+        self.assertEqual(max(counts), counts[0])
+
+        # seeded users can sign in
+        client = Client()
+        response = client.post('/api/signin/', {'username': 'seed-user-0', 'password': 'password'},
+                content_type='application/json')
+        self.assertEqual(response.status_code, 204)
+
+    def test_server_timing(self):
+        # off by default
+        client = Client()
+        response = client.get('/api/token/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+        with self.settings(BLOG_SERVER_TIMING=True):
+            client = Client()
+
+            # test user
+            response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+            self.assertIn('hash;dur=', response['Server-Timing'])
+
+            # log in
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+
+            response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                    content_type='application/json')
+            timing = response['Server-Timing']
+            for name in ['total', 'view', 'db', 'serialize']:
+                self.assertIn(f'{name};dur=', timing)
+            self.assertRegex(timing, r'db;dur=[0-9.]+;desc="\d+ queries"')
+
+            # over the thresholds
+            with self.settings(BLOG_TIMING_MAX_QUERIES=0, BLOG_TIMING_REPEATED_QUERIES=1):
+                with self.assertLogs('blog.timing', 'WARNING') as logs:
+                    response = client.get('/api/article/')
+            self.assertTrue(any('queries' in line for line in logs.output))
+            self.assertTrue(any('possible N+1' in line for line in logs.output))
+
+    def test_fragment_cache(self):
+        client = Client()
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # test articles and comments
+        response = client.post('/api/article/', [{'title': 'title', 'content': 'content'}] * 3,
+                content_type='application/json')
+        article_list = response.json()
+        url = f'/api/article/{article_list[0]["id"]}/comment/'
+        response = client.post(url, [{'content': 'content'}] * 3,
+                content_type='application/json')
+        comment_list = response.json()
+
+        def reads(url, params={}):
+            # the rows read in full, as opposed to just their id and version
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            return response.json(), [query['sql'] for query in queries if '"content"' in query['sql']]
+
+        # encoded once, then spliced from the cache
+        response_list, rows = reads('/api/article/')
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(response_list, [dict(article, comment_count=3 if i == 0 else 0)
+                for i, article in enumerate(article_list)])
+        self.assertEqual(reads('/api/article/'), (response_list, []))
+
+        # projections are cached separately
+        response_list, rows = reads('/api/article/', {'fields': 'title'})
+        self.assertEqual(len(rows), 0)
+        self.assertEqual(response_list, [{'id': article['id'], 'title': 'title'} for article in article_list])
+
+        # only the changed row is read again
+        client.put(f'/api/article/{article_list[1]["id"]}/', {'title': 'title2', 'content': 'content2'},
+                content_type='application/json')
+        with CaptureQueriesContext(connection) as queries:
+            response_list = client.get('/api/article/').json()
+        self.assertEqual([article['title'] for article in response_list], ['title', 'title2', 'title'])
+        self.assertEqual(sum(f'IN ({article_list[1]["id"]})' in query['sql'] for query in queries), 1)
+
+        # and deleted rows are gone
+        client.delete(f'/api/article/{article_list[2]["id"]}/')
+        response_list = client.get('/api/article/').json()
+        self.assertEqual([article['id'] for article in response_list], [article['id'] for article in article_list[:2]])
+
+        # same for comments
+        response_list, rows = reads(url)
+        self.assertEqual(response_list, comment_list)
+        self.assertEqual(reads(url), (comment_list, []))
+        client.put(f'/api/comment/{comment_list[0]["id"]}/', {'content': 'content2'},
+                content_type='application/json')
+        response_list, rows = reads(url)
+        self.assertEqual([comment['content'] for comment in response_list], ['content2', 'content', 'content'])
+        self.assertEqual(len(rows), 1)
+
+    def test_fast_delete(self):
+        client = Client()
+
+        # test users
+        for username in ['user1', 'user2']:
+            response = client.post('/api/signup/', {'username': username, 'password': 'pass'},
+                    content_type='application/json')
+
+        # articles by user1, commented on by both
+        response = client.post('/api/signin/', {'username': 'user1', 'password': 'pass'},
+                content_type='application/json')
+        response = client.post('/api/article/', [{'title': 'title', 'content': 'content'}] * 2,
+                content_type='application/json')
+        article_list = response.json()
+        for article in article_list:
+            response = client.post(f'/api/article/{article["id"]}/comment/', [{'content': 'content'}] * 3,
+                    content_type='application/json')
+        client.get('/api/signout/')
+        response = client.post('/api/signin/', {'username': 'user2', 'password': 'pass'},
+                content_type='application/json')
+        response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                content_type='application/json')
+        kept = response.json()
+        for article in article_list + [kept]:
+            response = client.post(f'/api/article/{article["id"]}/comment/', [{'content': 'content'}] * 2,
+                    content_type='application/json')
+        client.get('/api/signout/')
+
+        # deleting an article doesn't read its comments
+        response = client.post('/api/signin/', {'username': 'user1', 'password': 'pass'},
+                content_type='application/json')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.delete(f'/api/article/{article_list[0]["id"]}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(query['sql'].startswith('SELECT') and 'blog_comment' in query['sql'] for query in queries))
+        self.assertFalse(Comment.objects.filter(article_id=article_list[0]['id']).exists())
+        self.assertEqual(Comment.objects.count(), 7)
+        client.get('/api/signout/')
+
+        # nor does deleting a user read their comments, and by the time the
+        # collector looks for their articles they are gone
+        user = User.objects.get(username='user1')
+        with CaptureQueriesContext(connection) as queries:
+            delete_user(user)
+        self.assertFalse(any(query['sql'].startswith('SELECT "blog_comment"."id"') for query in queries))
+        self.assertFalse(User.objects.filter(username='user1').exists())
+        self.assertEqual(list(Article.objects.values_list('id', flat=True)), [kept['id']])
+        self.assertEqual(list(Comment.objects.values_list('article_id', flat=True)), [kept['id']] * 2)
+
+        # user1 had no comments on the article that's left
+        article = Article.objects.get(id=kept['id'])
+        self.assertEqual(article.comment_count, 2)
+
+        # the user admin deletes users the same way, one at a time or
+        # several at once
+        admin = Client()
+        admin.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+        uids = [User.objects.create_user(username=f'user{i}', password='pass').id for i in range(3, 6)]
+        deleted = []
+        with mock.patch('blog.admin.delete_user', lambda user: deleted.append(user.id) or delete_user(user)):
+            response = admin.post(f'/admin/auth/user/{uids[0]}/delete/', {'post': 'yes'})
+            self.assertEqual(response.status_code, 302)
+            response = admin.post('/admin/auth/user/', {'action': 'delete_selected', 'post': 'yes',
+                    '_selected_action': uids[1:]})
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(sorted(deleted), uids)
+        self.assertFalse(User.objects.filter(id__in=uids).exists())
+
+        # deleting an article through the api still sends delete signals
+        deleted = []
+        def receiver(sender, instance, **kwargs):
+            deleted.append((sender, instance.id))
+        post_delete.connect(receiver, sender=Comment)
+        post_delete.connect(receiver, sender=Article)
+        try:
+            response = client.post('/api/signin/', {'username': 'user2', 'password': 'pass'},
+                    content_type='application/json')
+            response = client.delete(f'/api/article/{kept["id"]}/')
+        finally:
+            post_delete.disconnect(receiver, sender=Comment)
+            post_delete.disconnect(receiver, sender=Article)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(sender.__name__ for sender, _ in deleted), ['Article', 'Comment', 'Comment'])
+
+    def test_conditional_writes(self):
+        client = Client()
+
+        # test users
+        for username in ['user1', 'user2']:
+            response = client.post('/api/signup/', {'username': username, 'password': 'pass'},
+                    content_type='application/json')
+
+        # test article and comment by user1
+        response = client.post('/api/signin/', {'username': 'user1', 'password': 'pass'},
+                content_type='application/json')
+        response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                content_type='application/json')
+        article = response.json()
+        url = f'/api/article/{article["id"]}/'
+        response = client.post(f'{url}comment/', {'content': 'content'},
+                content_type='application/json')
+        comment = response.json()
+        comment_url = f'/api/comment/{comment["id"]}/'
+
+        def blog_queries(method, url, data={}):
+            with CaptureQueriesContext(connection) as queries:
+                response = method(url, data, content_type='application/json')
+            return response, [query['sql'] for query in queries if 'blog_' in query['sql']]
+
+        # the update authorizes itself, no separate read of the row or author
+        response, queries = blog_queries(client.put, url, {'title': 'title2', 'content': 'content2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), dict(article, title='title2', content='content2', comment_count=1))
+        self.assertTrue(queries[0].startswith('UPDATE'))
+        self.assertIn('"author_id" = ', queries[0])
+        response, queries = blog_queries(client.put, comment_url, {'content': 'content2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), dict(comment, content='content2'))
+        self.assertTrue(queries[0].startswith('UPDATE'))
+
+        # missing rows
+        for method in [client.put, client.delete]:
+            for data in [{'title': 'title', 'content': 'content'}, {}]:
+                self.assertEqual(method('/api/article/1000/', data, content_type='application/json').status_code, 404)
+            for data in [{'content': 'content'}, {}]:
+                self.assertEqual(method('/api/comment/1000/', data, content_type='application/json').status_code, 404)
+
+        # someone else's rows, checked only once the write matched nothing
+        client.get('/api/signout/')
+        response = client.post('/api/signin/', {'username': 'user2', 'password': 'pass'},
+                content_type='application/json')
+        for data in [{'title': 'title3', 'content': 'content3'}, {}]:
+            self.assertEqual(client.put(url, data, content_type='application/json').status_code, 403)
+        for data in [{'content': 'content3'}, {}]:
+            self.assertEqual(client.put(comment_url, data, content_type='application/json').status_code, 403)
+        self.assertEqual(client.delete(comment_url).status_code, 403)
+        self.assertEqual(client.delete(url).status_code, 403)
+        self.assertEqual(Article.objects.get(id=article['id']).title, 'title2')
+        self.assertEqual(Comment.objects.get(id=comment['id']).content, 'content2')
+
+        # own deletes
+        client.get('/api/signout/')
+        response = client.post('/api/signin/', {'username': 'user1', 'password': 'pass'},
+                content_type='application/json')
+        response, queries = blog_queries(client.delete, comment_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Article.objects.get(id=article['id']).comment_count, 0)
+        response, queries = blog_queries(client.delete, url)
+        self.assertEqual(response.status_code, 200)
+        # QuerySet.delete() reads the articles it deletes, filtered on the
+        # author like the delete itself, and nothing else
+        selects = [sql for sql in queries if sql.startswith('SELECT')]
+        self.assertEqual(len(selects), 1)
+        self.assertIn('"author_id" = ', selects[0])
+        self.assertFalse(Article.objects.filter(id=article['id']).exists())
+
+    def test_parsing(self):
+        client = Client()
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # not json
+        response = client.post('/api/article/', {'title': 'title', 'content': 'content'})
+        self.assertEqual(response.status_code, 400)
+        response = client.post('/api/article/', '{"title": "title", "content": "content"}',
+                content_type='text/plain')
+        self.assertEqual(response.status_code, 400)
+
+        # fields are strings within the model's limits
+        for data in [{'title': 1, 'content': 'content'}, {'title': 'title', 'content': None},
+                {'title': 'x' * 65, 'content': 'content'}, ['title'], 'title']:
+            response = client.post('/api/article/', data, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        response = client.post('/api/article/', {'title': 'x' * 64, 'content': 'content'},
+                content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        article = response.json()
+
+        # one bad item rejects the whole list
+        response = client.post('/api/article/', [{'title': 'title', 'content': 'content'}, {'title': 'title'}],
+                content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = client.post(f'/api/article/{article["id"]}/comment/', [{'content': 'content'}, {'content': 2}],
+                content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Article.objects.count(), 1)
+        self.assertEqual(Comment.objects.count(), 0)
+
+        # too large, by the header alone, without reading the body
+        with self.settings(BLOG_MAX_BODY_SIZE=100):
+            response = client.put(f'/api/article/{article["id"]}/', {'title': 'title', 'content': 'x' * 100},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 413)
+            response = client.put(f'/api/article/{article["id"]}/', {'title': 'title', 'content': 'content'},
+                    content_type='application/json', CONTENT_LENGTH='1000000')
+            self.assertEqual(response.status_code, 413)
+            response = client.put(f'/api/article/{article["id"]}/', {'title': 'title', 'content': 'content'},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        with self.settings(BLOG_AUTH_MAX_BODY_SIZE=10):
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 413)
+
+    def test_throttle(self):
+        client = Client()
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # per username, wrong passwords count too
+        caches['throttle'].clear()
+        with self.settings(BLOG_THROTTLE_RATES={'ip': None, 'username': (2, 60)}):
+            for password in ['incorrect', 'pass']:
+                response = client.post('/api/signin/', {'username': 'user', 'password': password},
+                        content_type='application/json')
+                self.assertNotEqual(response.status_code, 429)
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 429)
+            self.assertTrue(1 <= int(response['Retry-After']) <= 30)
+            response = client.post('/api/bearer/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 429)
+
+            # other worker processes share the buckets
+            key = f'blog:throttle:username:{hashlib.sha1(b"user").hexdigest()}'
+            self.assertEqual(other_process('from django.core.cache import caches; '
+                    'print(caches["throttle"].get(sys.argv[2]) is not None)', key), 'True')
+
+            # other usernames aren't affected
+            response = client.post('/api/signup/', {'username': 'user2', 'password': 'pass'},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+
+        # per client ip, whatever the username
+        with self.settings(BLOG_THROTTLE_RATES={'ip': (3, 60), 'username': None}):
+            for i in range(3):
+                response = client.post('/api/signin/', {'username': f'nobody{i}', 'password': 'pass'},
+                        content_type='application/json')
+                self.assertEqual(response.status_code, 401)
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 429)
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json', REMOTE_ADDR='127.0.0.2')
+            self.assertEqual(response.status_code, 204)
+
+        # behind trusted proxies, per client ip from X-Forwarded-For. what
+        # the client put at its start doesn't count
+        caches['throttle'].clear()
+        with self.settings(BLOG_THROTTLE_RATES={'ip': (1, 60), 'username': None},
+                BLOG_TRUSTED_PROXIES=['127.0.0.1', '10.0.0.0/8']):
+            for forwarded in ['192.0.2.1', '198.51.100.1, 192.0.2.2, 10.0.0.1']:
+                response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                        content_type='application/json', HTTP_X_FORWARDED_FOR=forwarded)
+                self.assertEqual(response.status_code, 204)
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json', HTTP_X_FORWARDED_FOR='198.51.100.2, 192.0.2.1')
+            self.assertEqual(response.status_code, 429)
+
+            # untrusted peers can't pick their address
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json', REMOTE_ADDR='192.0.2.3', HTTP_X_FORWARDED_FOR='192.0.2.4')
+            self.assertEqual(response.status_code, 204)
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json', REMOTE_ADDR='192.0.2.3', HTTP_X_FORWARDED_FOR='192.0.2.5')
+            self.assertEqual(response.status_code, 429)
+
+        # buckets refill
+        caches['throttle'].clear()
+        # well over the time a signin takes to hash its password
+        with self.settings(BLOG_THROTTLE_RATES={'ip': (1, 1), 'username': None}):
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 204)
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 429)
+            time.sleep(1.1)
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 204)
+
+    def test_password_rehash(self):
+        client = Client()
+
+        def work_factors(iterations):
+            return dict(settings.BLOG_PASSWORD_WORK_FACTORS, pbkdf2_sha256={'iterations': iterations})
+
+        # test user, hashed with the old work factor
+        with self.settings(BLOG_PASSWORD_WORK_FACTORS=work_factors(1000)):
+            response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+        self.assertTrue(User.objects.get(username='user').password.startswith('pbkdf2_sha256$1000$'))
+
+        with self.settings(BLOG_PASSWORD_WORK_FACTORS=work_factors(2000)):
+            # a failed login leaves it alone
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'incorrect'},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 401)
+            self.assertTrue(User.objects.get(username='user').password.startswith('pbkdf2_sha256$1000$'))
+
+            # a successful one moves it to the new one
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 204)
+            self.assertTrue(User.objects.get(username='user').password.startswith('pbkdf2_sha256$2000$'))
+            self.assertEqual(client.get('/api/article/').status_code, 200)
+
+            # calibration suggests settings for the configured hashers, never
+            # weaker than django's own
+            out = StringIO()
+            err = StringIO()
+            call_command('calibrate_hashers', target_ms=1, runs=1, stdout=out, stderr=err)
+            self.assertIn("'pbkdf2_sha256': {'iterations': 150000}", out.getvalue())
+            self.assertIn('BLOG_PASSWORD_WORK_FACTORS = {', out.getvalue())
+            self.assertIn("below django's default of 150000", err.getvalue())
+
+    def test_replicas(self):
+        # the test replica mirrors the default database over another
+        # connection, which can't see this test's transaction. read through
+        # 'default' as if it were a replica instead
+        with self.settings(BLOG_REPLICAS=['default']):
+            client = Client()
+
+            # test user
+            response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+            self.assertIn('blog_primary', response.cookies)
+
+            # log in
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+
+            # test article
+            response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                    content_type='application/json')
+            article = response.json()
+            url = f'/api/article/{article["id"]}/'
+            self.assertEqual(response.cookies['blog_primary']['max-age'], settings.BLOG_REPLICA_PIN_SECONDS)
+
+            # reads don't pin, failed writes neither
+            response = client.get(url)
+            self.assertNotIn('blog_primary', response.cookies)
+            response = client.put(url, {}, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertNotIn('blog_primary', response.cookies)
+
+            # replica reads are served but not cached, they may be stale
+            del client.cookies['blog_primary']
+            caches['blog'].clear()
+            stats = client.get('/api/cache/stats/').json()
+            for _ in range(2):
+                response = client.get(url)
+                self.assertEqual(response.json()['title'], 'title')
+            self.assertEqual(client.get('/api/cache/stats/').json()['hits'], stats['hits'])
+
+            # pinned reads come from the primary, and are cached
+            response = client.put(url, {'title': 'title2', 'content': 'content2'},
+                    content_type='application/json')
+            self.assertIn('blog_primary', client.cookies)
+            for _ in range(2):
+                response = client.get(url)
+                self.assertEqual(response.json()['title'], 'title2')
+            self.assertGreater(client.get('/api/cache/stats/').json()['hits'], stats['hits'])
+
+        # no replicas, nothing to sync
+        with self.assertRaises(CommandError):
+            call_command('sync_replicas', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('sync_replicas', 'default', stdout=StringIO())
+
+    def test_export_import(self):
+        call_command('seed_blog', users=3, articles=5, comments=20, stdout=StringIO())
+        Article.objects.filter(id=Article.objects.order_by('id')[1].id).delete()
+
+        def dump():
+            return [list(model.objects.order_by('id').values()) for model in [User, Article, Comment]]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'blog.ndjson')
+            err = StringIO()
+            call_command('export_blog', output=path, stderr=err)
+            self.assertIn('exported 4 article rows', err.getvalue())
+            with open(path) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(len(lines), User.objects.count() + Article.objects.count() + Comment.objects.count())
+            self.assertEqual(json.loads(lines[0])['model'], 'user')
+
+            # only into an empty database
+            with self.assertRaises(CommandError):
+                call_command('import_blog', path, stderr=StringIO())
+            expected = dump()
+            User.objects.all().delete()
+
+            # interrupted partway through the articles, then resumed
+            partial = os.path.join(directory, 'partial.ndjson')
+            with open(partial, 'w') as f:
+                f.write('\n'.join(lines[:5]) + '\n')
+            call_command('import_blog', partial, batch_size=2, stderr=StringIO())
+            self.assertEqual(Article.objects.count(), 2)
+            err = StringIO()
+            call_command('import_blog', path, batch_size=2, resume=True, stderr=err)
+            self.assertIn('imported 2 article rows', err.getvalue())
+            self.assertIn('rows/s', err.getvalue())
+            self.assertEqual(dump(), expected)
+
+            # bad input
+            with open(partial, 'w') as f:
+                f.write('{"id": 1}\n')
+            with self.assertRaises(CommandError):
+                call_command('import_blog', partial, resume=True, stderr=StringIO())
+
+        # the imported articles are searchable, and new rows get fresh ids
+        self.assertTrue(search.search(Article.objects.first().title.split()[0], 0, 10))
+        article = Article.objects.create(title='title', content='content', author=User.objects.first())
+        self.assertGreater(article.id, expected[1][-1]['id'])
+
+    def test_comment_queue(self):
+        # bounded
+        queue = ingest.CommentQueue(2)
+        self.assertTrue(queue.submit(1, 1, 'content'))
+        self.assertTrue(queue.submit(1, 1, 'content'))
+        self.assertFalse(queue.submit(1, 1, 'content'))
+
+        # batches skip comments whose article or author is gone
+        user = User.objects.create_user(username='user', password='pass')
+        article = Article.objects.create(title='title', content='content', author=user)
+        ids = ingest.write([(article.id, user.id, 'content1'), (article.id + 1, user.id, 'content2'),
+                (article.id, user.id + 1, 'content3'), (article.id, user.id, 'content4')])
+        self.assertEqual(list(Comment.objects.values_list('content', flat=True)), ['content1', 'content4'])
+        first, second = Comment.objects.values_list('id', flat=True)
+        self.assertEqual(ids, [first, None, None, second])
+        article.refresh_from_db()
+        self.assertEqual((article.comment_count, article.version), (2, 2))
+
+        # a locked database is retried, and a comment the database refuses
+        # is dropped on its own. run() returns once stopped
+        write = ingest.write
+        calls = []
+        def locked_once(batch):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return write(batch)
+
+        queue = ingest.CommentQueue(10)
+        receipts = [queue.submit(article.id, user.id, content) for content in ['content5', None, 'content6']]
+        self.assertEqual([ingest.resolve(receipt) for receipt in receipts], [ingest.QUEUED] * 3)
+        queue.stop()
+        with mock.patch.object(ingest, 'write', locked_once), mock.patch.object(ingest, 'RETRY_DELAY', 0):
+            with self.assertLogs('blog.ingest', 'WARNING') as logs:
+                queue.run()
+        self.assertEqual(calls, [3, 3, 1, 1, 1])
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(list(Comment.objects.values_list('content', flat=True)),
+                ['content1', 'content4', 'content5', 'content6'])
+
+        # receipts resolve to the ids of the written comments, dropped and
+        # unknown ones to None
+        self.assertEqual([ingest.resolve(receipt) for receipt in receipts],
+                [Comment.objects.get(content=content).id if content else None for content in ['content5', None, 'content6']])
+        for receipt in [f'{"0" * 32}-0', 'receipt', f'{queue.id}-', f'{queue.id}--1']:
+            self.assertIsNone(ingest.resolve(receipt))
+        article.refresh_from_db()
+        self.assertEqual(article.comment_count, 4)
+
+        # a database that stays locked is retried for MAX_RETRY_TIME only,
+        # then each comment is tried once more and dropped
+        def locked(batch):
+            calls.append(len(batch))
+            raise OperationalError('database is locked')
+
+        calls = []
+        queue = ingest.CommentQueue(10)
+        for content in ['content7', 'content8']:
+            queue.submit(article.id, user.id, content)
+        queue.stop()
+        with mock.patch.object(ingest, 'write', locked), mock.patch.object(ingest, 'MAX_RETRY_TIME', 0):
+            with self.assertLogs('blog.ingest', 'ERROR') as logs:
+                queue.run()
+        self.assertEqual(calls, [2, 1, 1])
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(Comment.objects.count(), 4)
+
+        # flushing gives up after its timeout, here with no writer running
+        queue = ingest.CommentQueue(10)
+        queue.submit(article.id, user.id, 'content9')
+        self.assertFalse(queue.flush(0.01))
+        queue.stop()
+        queue.run()
+        self.assertTrue(queue.flush(0.01))
+
+    def test_long_poll(self):
+        client = Client()
+
+        # test user
+        response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # log in
+        response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                content_type='application/json')
+
+        # test article and comments
+        response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                content_type='application/json')
+        aid = response.json()['id']
+        url = f'/api/article/{aid}/comment/'
+        comments = []
+        for i in range(3):
+            response = client.post(url, {'content': f'content{i}'}, content_type='application/json')
+            comments.append(response.json())
+
+        # bad parameters
+        for params in [{'after_id': -1}, {'wait': 'invalid'}, {'wait': -1},
+                {'wait': settings.BLOG_LONG_POLL_MAX_WAIT + 1}, {'wait': 'nan'}]:
+            response = client.get(url, params)
+            self.assertEqual(response.status_code, 400)
+
+        # only newer comments
+        response = client.get(url, {'after_id': comments[0]['id']})
+        self.assertEqual(response.json(), comments[1:])
+
+        # nothing newer, answers empty once the wait is over
+        start = time.perf_counter()
+        response = client.get(url, {'after_id': comments[-1]['id'], 'wait': 0.1})
+        self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+        # woken by a new comment. the comment is written here, as the test
+        # database is only visible to this thread, and announced by a timer
+        # while the request waits
+        response = client.get(url, {'after_id': comments[-1]['id']})
+        self.assertEqual(response.json(), [])
+        comment = Comment.objects.create(article_id=aid, author=get_user(client), content='content3')
+
+        def announce():
+            cache.invalidate(f'article:{aid}:comments')
+            notify.notify(aid)
+        timer = threading.Timer(0.2, announce)
+        timer.start()
+        start = time.perf_counter()
+        response = client.get(url, {'after_id': comments[-1]['id'], 'wait': 10})
+        timer.join()
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertEqual([c['id'] for c in response.json()], [comment.id])
+
+        # a comment written through another worker process doesn't wake the
+        # request, but is there once the wait times out. the other process
+        # can't see the test database, so it only announces the comment
+        response = client.get(url, {'after_id': comment.id})
+        self.assertEqual(response.json(), [])
+        comment2 = Comment.objects.create(article_id=aid, author=get_user(client), content='content4')
+        timer = threading.Timer(0.1, other_process,
+                ['from blog import cache; cache.invalidate(sys.argv[2])', f'article:{aid}:comments'])
+        timer.start()
+        response = client.get(url, {'after_id': comment.id, 'wait': 3})
+        timer.join()
+        self.assertEqual([c['id'] for c in response.json()], [comment2.id])
+
+        # a long poll never ends in a 304
+        etag = client.get(url, {'after_id': comment.id})['ETag']
+        response = client.get(url, {'after_id': comment.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = client.get(url, {'after_id': comment.id, 'wait': 0.1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+@override_settings(CACHES=TEST_CACHES)
+class IngestTestCase(TransactionTestCase):
+    # the queue's writer thread has its own database connection, which only
+    # sees committed data. the in-memory test database locks whole tables, so
+    # requests and the writer take turns instead of overlapping
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def test_write_behind(self):
+        with self.settings(BLOG_COMMENT_QUEUE_SIZE=100):
+            client = Client()
+
+            # test user
+            response = client.post('/api/signup/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+
+            # log in
+            response = client.post('/api/signin/', {'username': 'user', 'password': 'pass'},
+                    content_type='application/json')
+
+            # test article
+            response = client.post('/api/article/', {'title': 'title', 'content': 'content'},
+                    content_type='application/json')
+            article = response.json()
+            url = f'/api/article/{article["id"]}/comment/'
+
+            # accepted, not yet written: no writer runs until the flush
+            queue = ingest._queue = ingest.CommentQueue(100)
+            receipts = []
+            for i in range(20):
+                response = client.post(url, {'content': f'content{i}'}, content_type='application/json')
+                self.assertEqual(response.status_code, 202)
+                data = response.json()
+                receipts.append(data.pop('receipt'))
+                self.assertEqual(data, {'article': article['id'], 'content': f'content{i}',
+                        'author': article['author']})
+                self.assertEqual(response['Location'], f'/api/comment/receipt/{receipts[-1]}/')
+            response = client.get(f'/api/comment/receipt/{receipts[0]}/')
+            self.assertEqual(response.status_code, 202)
+
+            # bad ones are still turned away up front
+            response = client.post(url, {'content': 1}, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            response = client.post('/api/article/1000/comment/', {'content': 'content'},
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 404)
+
+            writer = threading.Thread(target=queue.run)
+            writer.start()
+            queue.stop()
+            writer.join()
+            ingest._queue = None
+            response = client.get(url)
+            self.assertEqual([comment['content'] for comment in response.json()], [f'content{i}' for i in range(20)])
+            self.assertEqual(client.get(f'/api/article/{article["id"]}/').json()['comment_count'], 20)
+
+            # receipts resolve to the written comments, through any worker
+            # process
+            ids = [comment['id'] for comment in response.json()]
+            self.assertEqual([client.get(f'/api/comment/receipt/{receipt}/').json()['id'] for receipt in receipts], ids)
+            self.assertEqual(other_process('from blog import ingest; print(ingest.resolve(sys.argv[2]))', receipts[-1]),
+                    str(ids[-1]))
+            response = client.get('/api/comment/receipt/receipt/')
+            self.assertEqual(response.status_code, 404)
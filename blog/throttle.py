@@ -0,0 +1,74 @@
+import hashlib
+import ipaddress
+import math
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+# rate limits for the views that hash passwords, per client ip and per
+# username, in the 'throttle' cache alias. BLOG_THROTTLE_RATES maps each to
+# (requests, seconds): bursts of up to that many requests, refilling at that
+# many per that many seconds. a missing or None entry turns that limit off.
+#
+# the token bucket is kept as a single float per key (GCRA): the time at
+# which the bucket will be full again. each request pushes it seconds /
+# requests further out, and is refused if that would put it more than a
+# whole period ahead of now. reading and writing it isn't atomic, so racing
+# requests may let a few extra through.
+#
+# the client ip is REMOTE_ADDR, unless that is one of BLOG_TRUSTED_PROXIES:
+# then it is the last address in X-Forwarded-For that isn't a trusted proxy
+# itself. behind a proxy that isn't listed, every request seems to come from
+# the proxy and the per ip limit applies to the whole site at once
+
+def _cache():
+    return caches['throttle']
+
+def _take(key, requests, seconds):
+    # take a token from the bucket, returns 0 or the seconds until one is
+    # available
+    cache = _cache()
+    now = time.time()
+    full_at = max(cache.get(key, now), now) + seconds / requests
+    wait = full_at - seconds - now
+    if wait > 0:
+        return wait
+    cache.set(key, full_at, math.ceil(full_at - now))
+    return 0
+
+def _trusted(address):
+    try:
+        address = ipaddress.ip_address(address.strip())
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(proxy) for proxy in settings.BLOG_TRUSTED_PROXIES)
+
+def client_ip(request):
+    # the address the request came from, seen through trusted proxies. each
+    # proxy appends the address it got the request from to X-Forwarded-For,
+    # so the list is read from the right, where the client can't forge it
+    address = request.META.get('REMOTE_ADDR')
+    if address is None or not _trusted(address):
+        return address
+    forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+    for address in reversed(forwarded):
+        if not _trusted(address):
+            return address
+    # only proxies, or nothing forwarded: the first address is the best guess
+    return forwarded[0] if forwarded else address
+
+def check(request, username):
+    # None if the request may go ahead, otherwise a 429 response
+    rates = settings.BLOG_THROTTLE_RATES
+    for scope, value in [('ip', client_ip(request)), ('username', username)]:
+        if rates.get(scope) is None:
+            continue
+        # usernames can hold anything, keep keys safe for any cache backend
+        digest = hashlib.sha1(str(value).encode()).hexdigest()
+        wait = _take(f'blog:throttle:{scope}:{digest}', *rates[scope])
+        if wait:
+            response = HttpResponse(status=429)
+            response['Retry-After'] = math.ceil(wait)
+            return response
+    return None
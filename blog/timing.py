@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from django import http
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+# opt-in per-request timing (BLOG_SERVER_TIMING), reported in a Server-Timing
+# header and logged when over the BLOG_TIMING_* thresholds. phases:
+#   total      everything inside the middleware
+#   view       from view dispatch until the response comes back
+#   db         SQL, with the query count
+#   serialize  JSON encoding, for non-streaming responses
+#   hash       password hashing
+# the last two are measured where they happen, with phase()
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+class _Timer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_start = None
+        # seconds spent per phase
+        self.phases = Counter()
+        # times each SQL text ran, repeats hint at N+1 query patterns
+        self.queries = Counter()
+
+@contextmanager
+def phase(name):
+    # add the time spent in the block to the current request's phase, if the
+    # request is being timed
+    timer = getattr(_local, 'timer', None)
+    if timer is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.phases[name] += time.perf_counter() - start
+
+class JsonResponse(http.JsonResponse):
+    # encoding happens in the constructor, time it as serialization
+
+    def __init__(self, *args, **kwargs):
+        with phase('serialize'):
+            super().__init__(*args, **kwargs)
+
+class ServerTimingMiddleware:
+    # put first in MIDDLEWARE so total covers the other middleware too
+
+    def __init__(self, get_response):
+        if not settings.BLOG_SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = _local.timer = _Timer()
+        try:
+            with connection.execute_wrapper(self.record):
+                response = self.get_response(request)
+        finally:
+            _local.timer = None
+        end = time.perf_counter()
+
+        metrics = [('total', end - timer.start, None)]
+        if timer.view_start is not None:
+            metrics.append(('view', end - timer.view_start, None))
+        query_count = sum(timer.queries.values())
+        metrics.append(('db', timer.phases['db'], f'{query_count} queries'))
+        for name in ('serialize', 'hash'):
+            if name in timer.phases:
+                metrics.append((name, timer.phases[name], None))
+
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={seconds * 1000:.2f}' + (f';desc="{desc}"' if desc else '')
+            for name, seconds, desc in metrics)
+
+        self.check(request, end - timer.start, timer)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _local.timer.view_start = time.perf_counter()
+
+    def record(self, execute, sql, params, many, context):
+        timer = _local.timer
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            timer.phases['db'] += time.perf_counter() - start
+            timer.queries[sql] += 1
+
+    def check(self, request, total, timer):
+        where = f'{request.method} {request.path}'
+        if total * 1000 > settings.BLOG_TIMING_SLOW_MS:
+            logger.warning('%s took %.1f ms (%.1f ms in SQL)', where, total * 1000, timer.phases['db'] * 1000)
+
+        query_count = sum(timer.queries.values())
+        if query_count > settings.BLOG_TIMING_MAX_QUERIES:
+            logger.warning('%s ran %d queries', where, query_count)
+
+        for sql, count in timer.queries.items():
+            if count >= settings.BLOG_TIMING_REPEATED_QUERIES:
+                logger.warning('%s ran the same query %d times, possible N+1: %s', where, count, sql)
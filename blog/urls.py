@@ -12,8 +12,12 @@ urlpatterns = [
     path('signin/', csrf_exempt(views.signin), name='signin'),
     path('signout/', csrf_exempt(views.signout), name='signout'),
     path('article/', csrf_exempt(views.articles), name='articles'),
+    path('article/search/', csrf_exempt(views.article_search), name='article-search'),
     path('article/<int:aid>/', csrf_exempt(views.article), name='article'),
     path('article/<int:aid>/comment/', csrf_exempt(views.article_comment), name='article-comment'),
     path('comment/<int:cid>/', csrf_exempt(views.comments), name='comments'),
+    path('comment/receipt/<str:receipt>/', csrf_exempt(views.comment_receipt), name='comment-receipt'),
+    path('cache/stats/', csrf_exempt(views.cache_stats), name='cache-stats'),
+    path('bearer/', csrf_exempt(views.bearer), name='bearer'),
     path('token/', csrf_exempt(views.token), name='token'),
 ]
@@ -1,24 +1,346 @@
-from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseBadRequest, HttpResponseNotFound, HttpResponseForbidden, JsonResponse
+import os
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseBadRequest, HttpResponseNotFound, HttpResponseForbidden, StreamingHttpResponse
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login, logout
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Prefetch, Sum, prefetch_related_objects
 from django.views.decorators.csrf import ensure_csrf_cookie
-import json
+from django.views.decorators.http import condition
+from django.core.serializers.json import DjangoJSONEncoder
+from django.conf import settings
+from django.urls import reverse
+from . import cache, ingest, notify, parsing, search, throttle
+from .auth import issue_token
+from .routers import replica_reads
+from .timing import JsonResponse, phase
 from .models import Article, Comment
 
+# api field name to database column, for ?fields= projections
+ARTICLE_COLUMNS = {
+    'id': 'id',
+    'title': 'title',
+    'content': 'content',
+    'author': 'author_id',
+    'comment_count': 'comment_count',
+}
+COMMENT_COLUMNS = {
+    'id': 'id',
+    'article': 'article_id',
+    'content': 'content',
+    'author': 'author_id',
+}
+
+# most SELECTs sqlite joins into one compound query by default
+MAX_COMPOUND_SELECT = 500
+
+# request bodies, see parsing.py
+CREDENTIALS = dict(parsing.fields(User, 'username'), password=None)
+ARTICLE_FIELDS = parsing.fields(Article, 'title', 'content')
+COMMENT_FIELDS = parsing.fields(Comment, 'content')
+
+def _rename(row):
+    # rename <field>_id foreign key columns to just <field>
+    for column in ('article_id', 'author_id'):
+        if column in row:
+            row[column[:-3]] = row.pop(column)
+    return row
+
+def _columns(request, columns):
+    # parse ?fields=a,b into the columns to select, raises KeyError on unknown
+    # fields. id is always selected, list pagination depends on it
+    if 'fields' not in request.GET:
+        return list(columns.values())
+    names = request.GET['fields'].split(',')
+    return list(dict.fromkeys(['id'] + [columns[name] for name in names]))
+
+def _include(request):
+    # parse ?include=comments, raises KeyError on anything else
+    if 'include' not in request.GET:
+        return False
+    if request.GET['include'] != 'comments':
+        raise KeyError(request.GET['include'])
+    return True
+
+def _stream(request):
+    # parse ?stream=1, or 0 for the paginated list, raises KeyError on
+    # anything else
+    value = request.GET.get('stream', '0')
+    if value not in ('0', '1'):
+        raise KeyError(value)
+    return value == '1'
+
+def _comment_limit(request, default):
+    # parse ?comment_limit=<n> for ?include=comments, raises ValueError on bad
+    # input
+    if 'comment_limit' not in request.GET:
+        return default
+    limit = int(request.GET['comment_limit'])
+    if not 0 < limit <= settings.BLOG_MAX_PAGE_SIZE:
+        raise ValueError
+    return limit
+
+def _prefetch_comments(articles, limit):
+    # set article.comment_list to the article's comments in id order, the
+    # first limit of them if limit is set. ordering by article first lets the
+    # article index, which ends in the id, return rows presorted.
+    #
+    # with a limit, each article's comments are read as a range of that
+    # index that ends after limit rows, however long the thread is: one
+    # UNION ALL part per article, MAX_COMPOUND_SELECT articles per query
+    if limit is None:
+        prefetch_related_objects(articles, Prefetch('comment_set',
+                queryset=Comment.objects.order_by('article', 'id'), to_attr='comment_list'))
+        return
+
+    # the part is compiled once, for a placeholder article id, and repeated:
+    # building a queryset per article costs more than running the query
+    first = Comment.objects.filter(article_id=0).order_by('id').values('id')[:limit]
+    part, _ = Comment.objects.filter(id__in=first).query.sql_with_params()
+    comment_lists = {article.id: [] for article in articles}
+    aids = list(comment_lists)
+    for start in range(0, len(aids), MAX_COMPOUND_SELECT):
+        chunk = aids[start:start + MAX_COMPOUND_SELECT]
+        for comment in Comment.objects.raw(' UNION ALL '.join([part] * len(chunk)), chunk):
+            comment_lists[comment.article_id].append(comment)
+    for article in articles:
+        article.comment_list = sorted(comment_lists[article.id], key=lambda comment: comment.id)
+
+def _with_comments(article, columns):
+    # an article instance with its prefetched comments, as a response dict
+    row = _rename({column: getattr(article, column) for column in columns})
+    row['comments'] = [_rename({column: getattr(comment, column) for column in COMMENT_COLUMNS.values()})
+            for comment in article.comment_list]
+    return row
+
+def _page(request, cursor='after'):
+    # parse ?after=<id>&limit=<n>, raises ValueError on bad input
+    after = int(request.GET.get(cursor, 0))
+    limit = int(request.GET.get('limit', settings.BLOG_PAGE_SIZE))
+    if after < 0 or not 0 < limit <= settings.BLOG_MAX_PAGE_SIZE:
+        raise ValueError
+    return after, limit
+
+def _wait(request):
+    # parse ?wait=<seconds> for long polls, raises ValueError on bad input
+    wait = float(request.GET.get('wait', 0))
+    if not 0 <= wait <= settings.BLOG_LONG_POLL_MAX_WAIT:
+        raise ValueError
+    return wait
+
+def _page_response(rows, limit):
+    # rows holds up to limit + 1 entries, the extra one only signals that
+    # another page exists
+    response = JsonResponse(rows[:limit], safe=False)
+    if len(rows) > limit:
+        response['X-Next-Cursor'] = rows[limit - 1]['id']
+    return response
+
+def _fragment_key(model, columns, aid, version):
+    return ':'.join(['fragment', model._meta.model_name, str(aid), str(version)] + columns)
+
+def _fragments(model, columns, stamps):
+    # the encoded JSON of each row in stamps, a list of {id, version} dicts.
+    # encodings are cached by id and version, and every change to a row bumps
+    # its version, so only rows changed since they were last encoded are read
+    # and encoded again. the fragments of a deleted row are never asked for
+    # again and age out of the cache
+    keys = {stamp['id']: _fragment_key(model, columns, stamp['id'], stamp['version']) for stamp in stamps}
+
+    def load(missing):
+        missing = set(missing)
+        ids = [stamp['id'] for stamp in stamps if keys[stamp['id']] in missing]
+        rows = model.objects.filter(id__in=ids).values(*columns)
+        encoder = DjangoJSONEncoder()
+        with phase('serialize'):
+            # a row changed since its stamp was read is filed under the old
+            # version. harmless, as versions only go up
+            return {keys[row['id']]: encoder.encode(_rename(row)).encode() for row in rows}
+
+    fragments = cache.get_many(list(keys.values()), load)
+    # rows deleted since the stamps were read are left out
+    return [fragments[key] for key in keys.values() if key in fragments]
+
+def _fragment_page_response(model, columns, stamps, limit):
+    # like _page_response, for a page of {id, version} stamps. the rows are
+    # spliced together from cached fragments instead of encoded from scratch
+    fragments = _fragments(model, columns, stamps[:limit])
+    with phase('serialize'):
+        content = b'[' + b','.join(fragments) + b']'
+    response = HttpResponse(content, content_type='application/json')
+    if len(stamps) > limit:
+        response['X-Next-Cursor'] = stamps[limit - 1]['id']
+    return response
+
+def _bulk_create(model, objs):
+    # insert all objs in one transaction and fill in their ids
+    with transaction.atomic():
+        model.objects.bulk_create(objs)
+        if objs and objs[-1].pk is None:
+            # sqlite can't return the new ids, but the transaction holds the
+            # write lock from the first insert on, so they are consecutive
+            # and end at the current max
+            last_id = model.objects.aggregate(Max('id'))['id__max']
+            for pk, obj in enumerate(objs, last_id - len(objs) + 1):
+                obj.pk = pk
+    return objs
+
+def _count_comments(aid, delta):
+    # keep the denormalized comment_count in step. the article's
+    # representation changes with it, so bump its version too
+    Article.objects.filter(id=aid).update(comment_count=F('comment_count') + delta, version=F('version') + 1)
+
+def _denied(model, pk, user):
+    # for a write filtered on the author that matched nothing: 404 if there
+    # is no such row, 403 if it belongs to someone else. None if it's the
+    # user's own after all
+    author_id = model.objects.filter(id=pk).values_list('author_id', flat=True).first()
+    if author_id is None:
+        return HttpResponseNotFound()
+    if author_id != user.id:
+        return HttpResponseForbidden()
+    return None
+
+def _stream_response(queryset):
+    # encode rows as they are read off the database cursor, one chunk of
+    # rows at a time, instead of materializing the whole list first
+    chunk_size = settings.BLOG_STREAM_CHUNK_SIZE
+    encoder = DjangoJSONEncoder()
+
+    def encode():
+        yield '['
+        chunk = []
+        separator = ''
+        for row in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(encoder.encode(_rename(row)))
+            if len(chunk) == chunk_size:
+                yield separator + ','.join(chunk)
+                chunk = []
+                separator = ','
+        if chunk:
+            yield separator + ','.join(chunk)
+        yield ']'
+
+    return StreamingHttpResponse(encode(), content_type='application/json')
+
+# ETags for conditional GETs. any change to a row, including an article's
+# comment_count, bumps the row version; for lists, the row
+# count and max id catch inserts and deletes, and the version sum catches
+# edits to any row, not only the newest one
+
+def _list_etag(count, version_sum, max_id):
+    return f'{count}.{version_sum or 0}.{max_id or 0}'
+
+def _articles_etag(request):
+    # embedded comments aren't covered, don't make those conditional
+    if request.method != 'GET' or not request.user.is_authenticated or 'include' in request.GET:
+        return None
+    return _list_etag(*_get_articles_stamp())
+
+def _article_etag(request, aid):
+    if request.method != 'GET' or not request.user.is_authenticated or 'include' in request.GET:
+        return None
+    try:
+        article = _get_article(aid, _columns(request, ARTICLE_COLUMNS))
+    except KeyError:
+        return None
+    return f'{aid}.{article["version"]}' if article is not None else None
+
+def _article_comment_etag(request, aid):
+    # a long poll waits for a change, it mustn't end early with a 304
+    if request.method != 'GET' or not request.user.is_authenticated or 'wait' in request.GET:
+        return None
+    stamp = _get_comment_stamp(aid)
+    return _list_etag(*stamp) if stamp is not None else None
+
+def _comment_etag(request, cid):
+    if request.method != 'GET' or not request.user.is_authenticated:
+        return None
+    try:
+        comment = _get_comment(cid, _columns(request, COMMENT_COLUMNS))
+    except KeyError:
+        return None
+    return f'{cid}.{comment["version"]}' if comment is not None else None
+
+# read-through cached reads, see cache.py. writes invalidate these names:
+#   articles                the article list etag stamp, on any article change
+#   article:<aid>           the article row
+#   article:<aid>:comments  the article's comment list pages and etag stamp
+#   article:<aid>:alive     only on delete, for comments cascaded with it
+#   user:<uid>:alive        only on delete, for comments cascaded with them
+#   comment:<cid>           the comment row
+# rows carry their version for the etag, and None means no such row
+
+def _get_article(aid, columns):
+    def load():
+        return Article.objects.filter(id=aid).values(*columns, 'version').first()
+    return cache.get(cache.key(f'article:{aid}', *columns), load)
+
+def _comment_alive(comment):
+    # the tokens of the names invalidated when the comment's article or
+    # author is deleted, taking the comment with it
+    return (cache.token(f'article:{comment["article_id"]}:alive'),
+            cache.token(f'user:{comment["author_id"]}:alive'))
+
+def _get_comment(cid, columns):
+    def load():
+        comment = (Comment.objects.filter(id=cid)
+                .values(*dict.fromkeys(columns + ['article_id', 'author_id', 'version'])).first())
+        if comment is None:
+            return None
+        return _comment_alive(comment), comment
+
+    entry = cache.get(cache.key(f'comment:{cid}', *columns), load)
+    if entry is not None and entry[0] != _comment_alive(entry[1]):
+        # the article or author may have been deleted, taking this comment
+        # with it
+        cache.invalidate(f'comment:{cid}')
+        entry = cache.get(cache.key(f'comment:{cid}', *columns), load)
+    return entry[1] if entry is not None else None
+
+def _get_comment_page(aid, after, limit):
+    # the ids and versions of a page of comments, see _fragments for the rows
+    def load():
+        if not Article.objects.filter(id=aid).exists():
+            return None
+        return list(Comment.objects.filter(article_id=aid, id__gt=after).order_by('id').values('id', 'version')[:limit + 1])
+    return cache.get(cache.key(f'article:{aid}:comments', after, limit), load)
+
+def _get_articles_stamp():
+    def load():
+        # a scan of the whole table, run once per article change at most.
+        # the 'articles' token is shared by the worker processes, so a change
+        # made through any of them reaches the stamp cached in all of them
+        stamp = Article.objects.aggregate(Count('id'), Sum('version'), Max('id'))
+        return stamp['id__count'], stamp['version__sum'], stamp['id__max']
+    return cache.get(cache.key('articles', 'stamp'), load)
+
+def _get_comment_stamp(aid):
+    def load():
+        # one query, no rows if the article doesn't exist
+        return (Article.objects.filter(id=aid).values('id')
+                .annotate(count=Count('comment'), version_sum=Sum('comment__version'), max_id=Max('comment__id'))
+                .values_list('count', 'version_sum', 'max_id').first())
+    return cache.get(cache.key(f'article:{aid}:comments', 'stamp'), load)
+
 def signup(request):
     if request.method != 'POST':
         return HttpResponseNotAllowed(['POST'])
 
     try:
-        req_data = json.loads(request.body.decode())
-        username = req_data['username']
-        password = req_data['password']
-    except (ValueError, KeyError):
-        return HttpResponseBadRequest()
+        req_data = parsing.parse(request, CREDENTIALS, settings.BLOG_AUTH_MAX_BODY_SIZE)
+    except parsing.ParseError as error:
+        return error.response()
+    username = req_data['username']
+    password = req_data['password']
+
+    # before hashing the password
+    throttled = throttle.check(request, username)
+    if throttled:
+        return throttled
 
     try:
-        User.objects.create_user(username=username, password=password)
+        with phase('hash'):
+            User.objects.create_user(username=username, password=password)
     except IntegrityError:
         # duplicate user
         return HttpResponseBadRequest()
@@ -30,19 +352,52 @@ def signin(request):
         return HttpResponseNotAllowed(['POST'])
 
     try:
-        req_data = json.loads(request.body.decode())
-        username = req_data['username']
-        password = req_data['password']
-    except (ValueError, KeyError):
-        return HttpResponseBadRequest()
-
-    user = authenticate(request, username=username, password=password)
+        req_data = parsing.parse(request, CREDENTIALS, settings.BLOG_AUTH_MAX_BODY_SIZE)
+    except parsing.ParseError as error:
+        return error.response()
+    username = req_data['username']
+    password = req_data['password']
+
+    # before hashing the password
+    throttled = throttle.check(request, username)
+    if throttled:
+        return throttled
+
+    with phase('hash'):
+        user = authenticate(request, username=username, password=password)
     if user == None:
         return HttpResponse(status=401)
 
     login(request, user)
     return HttpResponse(status=204)
 
+def bearer(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    try:
+        req_data = parsing.parse(request, CREDENTIALS, settings.BLOG_AUTH_MAX_BODY_SIZE)
+    except parsing.ParseError as error:
+        return error.response()
+    username = req_data['username']
+    password = req_data['password']
+
+    # before hashing the password
+    throttled = throttle.check(request, username)
+    if throttled:
+        return throttled
+
+    with phase('hash'):
+        user = authenticate(request, username=username, password=password)
+    if user == None:
+        return HttpResponse(status=401)
+
+    response_dict = {
+        'token': issue_token(user),
+        'expires_in': settings.BLOG_TOKEN_MAX_AGE,
+    }
+    return JsonResponse(response_dict)
+
 def signout(request):
     if request.method != 'GET':
         return HttpResponseNotAllowed(['GET'])
@@ -53,6 +408,8 @@ def signout(request):
     logout(request)
     return HttpResponse(status=204)
 
+@replica_reads
+@condition(etag_func=_articles_etag)
 def articles(request):
     if request.method not in ['GET', 'POST']:
         return HttpResponseNotAllowed(['GET', 'POST'])
@@ -61,88 +418,173 @@ def articles(request):
         return HttpResponseForbidden()
 
     if request.method == 'GET':
-        # article list
-        article_list = list(Article.objects.all().values())
-        # need to rename author_id to author
-        for article in article_list:
-            article['author'] = article['author_id']
-            del article['author_id']
-        return JsonResponse(article_list, safe=False)
+        try:
+            columns = _columns(request, ARTICLE_COLUMNS)
+            include = _include(request)
+            stream = _stream(request)
+        except KeyError:
+            return HttpResponseBadRequest()
 
-    else: # request.method == 'POST':
-        # new article
+        if stream:
+            # full article list, streamed
+            if include:
+                return HttpResponseBadRequest()
+            return _stream_response(Article.objects.order_by('id').values(*columns))
+
+        # article list, paginated by id
         try:
-            req_data = json.loads(request.body)
-            title = req_data['title']
-            content = req_data['content']
-        except (ValueError, KeyError):
+            after, limit = _page(request)
+            comment_limit = _comment_limit(request, settings.BLOG_INCLUDE_COMMENT_LIMIT)
+        except ValueError:
             return HttpResponseBadRequest()
 
+        if include:
+            # with the first comment_limit comments of each, in two queries
+            articles = list(Article.objects.filter(id__gt=after).order_by('id').only(*columns)[:limit + 1])
+            _prefetch_comments(articles, comment_limit)
+            return _page_response([_with_comments(article, columns) for article in articles], limit)
+
+        stamps = list(Article.objects.filter(id__gt=after).order_by('id').values('id', 'version')[:limit + 1])
+        return _fragment_page_response(Article, columns, stamps, limit)
+
+    else: # request.method == 'POST':
+        # new article, or a list of them
+        try:
+            req_data = parsing.parse(request, ARTICLE_FIELDS, settings.BLOG_BULK_MAX_BODY_SIZE, many=True)
+        except parsing.ParseError as error:
+            return error.response()
+
+        if isinstance(req_data, list):
+            new_articles = [Article(title=item['title'], content=item['content'], author=request.user)
+                    for item in req_data]
+            response_list = [{
+                'id': new_article.id,
+                'title': new_article.title,
+                'content': new_article.content,
+                'author': request.user.id,
+                'comment_count': 0,
+            } for new_article in _bulk_create(Article, new_articles)]
+            cache.invalidate('articles')
+            return JsonResponse(response_list, safe=False, status=201)
+
+        title = req_data['title']
+        content = req_data['content']
         new_article = Article(title=title, content=content, author=request.user)
         new_article.save()
+        cache.invalidate('articles')
 
         response_dict = {
             'id': new_article.id,
             'title': title,
             'content': content,
             'author': request.user.id,
+            'comment_count': 0,
         }
         return JsonResponse(response_dict, status=201)
 
-def article(request, aid):
-    if request.method not in ['GET', 'PUT', 'DELETE']:
-        return HttpResponseNotAllowed(['GET', 'PUT', 'DELETE'])
+def article_search(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
 
     if not request.user.is_authenticated:
         return HttpResponseForbidden()
 
     try:
-        article = Article.objects.get(id=aid)
-    except Article.DoesNotExist:
-        return HttpResponseNotFound()
+        columns = _columns(request, ARTICLE_COLUMNS)
+        text = request.GET['q']
+    except KeyError:
+        return HttpResponseBadRequest()
 
-    if request.method == 'GET':
-        # view article
-        response_dict = {
-            'id': article.id,
-            'title': article.title,
-            'content': article.content,
-            'author': article.author_id,
-        }
-        return JsonResponse(response_dict)
+    # the cursor is an offset into the ranking here, not an id
+    try:
+        offset, limit = _page(request)
+    except ValueError:
+        return HttpResponseBadRequest()
 
-    elif request.method == 'PUT':
-        # edit article
-        if request.user != article.author:
-            return HttpResponseForbidden()
+    if not text.split():
+        return HttpResponseBadRequest()
 
+    ids = search.search(text, offset, limit + 1)
+    rows = {row['id']: row for row in Article.objects.filter(id__in=ids).values(*columns)}
+    # skipping any article deleted since the search
+    article_list = [_rename(rows[aid]) for aid in ids[:limit] if aid in rows]
+
+    response = JsonResponse(article_list, safe=False)
+    if len(ids) > limit:
+        response['X-Next-Cursor'] = offset + limit
+    return response
+
+@replica_reads
+@condition(etag_func=_article_etag)
+def article(request, aid):
+    if request.method not in ['GET', 'PUT', 'DELETE']:
+        return HttpResponseNotAllowed(['GET', 'PUT', 'DELETE'])
+
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden()
+
+    if request.method == 'GET':
+        # view article, reading only the requested fields
         try:
-            req_data = json.loads(request.body)
-            title = req_data['title']
-            content = req_data['content']
-        except (ValueError, KeyError):
+            columns = _columns(request, ARTICLE_COLUMNS)
+            include = _include(request)
+            comment_limit = _comment_limit(request, None)
+        except (KeyError, ValueError):
             return HttpResponseBadRequest()
 
-        article.title = title
-        article.content = content
-        article.save()
+        if include:
+            # with its comments, in two queries
+            article = Article.objects.filter(id=aid).only(*columns).first()
+            if article is None:
+                return HttpResponseNotFound()
+            _prefetch_comments([article], comment_limit)
+            return JsonResponse(_with_comments(article, columns))
+
+        article = _get_article(aid, columns)
+        if article is None:
+            return HttpResponseNotFound()
+        del article['version']
+        return JsonResponse(_rename(article))
+
+    # writes only match the user's own article, in one statement that both
+    # authorizes and writes. _denied() tells why when nothing matched
+    owned = Article.objects.filter(id=aid, author=request.user)
+
+    if request.method == 'PUT':
+        # edit article
+        try:
+            req_data = parsing.parse(request, ARTICLE_FIELDS, settings.BLOG_MAX_BODY_SIZE)
+        except parsing.ParseError as error:
+            # not being allowed to edit comes first
+            return _denied(Article, aid, request.user) or error.response()
+        title = req_data['title']
+        content = req_data['content']
+
+        with transaction.atomic():
+            # comment_count is maintained concurrently, don't write it
+            if not owned.update(title=title, content=content, version=F('version') + 1):
+                return _denied(Article, aid, request.user) or HttpResponseNotFound()
+            comment_count = owned.values_list('comment_count', flat=True).get()
+        cache.invalidate('articles', f'article:{aid}')
 
         response_dict = {
-            'id': article.id,
-            'title': article.title,
-            'content': article.content,
-            'author': article.author_id,
+            'id': aid,
+            'title': title,
+            'content': content,
+            'author': request.user.id,
+            'comment_count': comment_count,
         }
         return JsonResponse(response_dict)
 
     else: # request.method == 'DELETE':
-        # delete article
-        if request.user != article.author:
-            return HttpResponseForbidden()
-
-        article.delete()
+        # delete article, django removes its comments without loading them
+        if not owned.delete()[0]:
+            return _denied(Article, aid, request.user) or HttpResponseNotFound()
+        cache.invalidate('articles', f'article:{aid}', f'article:{aid}:comments', f'article:{aid}:alive')
         return HttpResponse(status=200)
 
+@replica_reads
+@condition(etag_func=_article_comment_etag)
 def article_comment(request, aid):
     if request.method not in ['GET', 'POST']:
         return HttpResponseNotAllowed(['GET', 'POST'])
@@ -150,40 +592,108 @@ def article_comment(request, aid):
     if not request.user.is_authenticated:
         return HttpResponseForbidden()
 
-    try:
-        article = Article.objects.get(id=aid)
-    except Article.DoesNotExist:
-        return HttpResponseNotFound()
-
     if request.method == 'GET':
-        comment_list = list(Comment.objects.filter(article=article).order_by('id').values())
-        # rename _id fields to just themselves
-        for comment in comment_list:
-            comment['article'] = comment['article_id']
-            del comment['article_id']
-            comment['author'] = comment['author_id']
-            del comment['author_id']
-        return JsonResponse(comment_list, safe=False)
+        try:
+            columns = _columns(request, COMMENT_COLUMNS)
+            stream = _stream(request)
+        except KeyError:
+            return HttpResponseBadRequest()
 
-    else: # request.method == 'POST':
-        # new comment
+        if stream:
+            # full comment list, streamed
+            if not Article.objects.filter(id=aid).exists():
+                return HttpResponseNotFound()
+            return _stream_response(Comment.objects.filter(article_id=aid).order_by('id').values(*columns))
+
+        # comment list, paginated by id. clients following a thread pass
+        # the last id they have as ?after_id= to get only newer comments
         try:
-            req_data = json.loads(request.body)
-            content = req_data['content']
-        except (ValueError, KeyError):
+            after, limit = _page(request, 'after_id' if 'after_id' in request.GET else 'after')
+            wait = _wait(request)
+        except ValueError:
             return HttpResponseBadRequest()
 
-        new_comment = Comment(article=article, content=content, author=request.user)
-        new_comment.save()
+        if not wait:
+            stamps = _get_comment_page(aid, after, limit)
+        else:
+            # long poll: if there is nothing newer yet, hold the request
+            # until a comment arrives or wait seconds pass, see notify.py.
+            # read again either way, comments written through other
+            # processes don't wake it
+            with notify.watch(aid) as watcher:
+                stamps = _get_comment_page(aid, after, limit)
+                if stamps == []:
+                    watcher.wait(wait)
+                    stamps = _get_comment_page(aid, after, limit)
+        if stamps is None:
+            return HttpResponseNotFound()
+        return _fragment_page_response(Comment, columns, stamps, limit)
 
-        response_dict = {
+    try:
+        # only the id is needed, don't read the article body
+        article = Article.objects.only('id').get(id=aid)
+    except Article.DoesNotExist:
+        return HttpResponseNotFound()
+
+    # request.method == 'POST', new comment, or a list of them
+    try:
+        req_data = parsing.parse(request, COMMENT_FIELDS, settings.BLOG_BULK_MAX_BODY_SIZE, many=True)
+    except parsing.ParseError as error:
+        return error.response()
+
+    if isinstance(req_data, list):
+        new_comments = [Comment(article=article, content=item['content'], author=request.user)
+                for item in req_data]
+        with transaction.atomic():
+            _bulk_create(Comment, new_comments)
+            _count_comments(aid, len(new_comments))
+        cache.invalidate('articles', f'article:{aid}', f'article:{aid}:comments')
+        notify.notify(aid)
+
+        response_list = [{
             'id': new_comment.id,
             'article': new_comment.article_id,
             'content': new_comment.content,
             'author': new_comment.author_id,
+        } for new_comment in new_comments]
+        return JsonResponse(response_list, safe=False, status=201)
+
+    if settings.BLOG_COMMENT_QUEUE_SIZE:
+        # write-behind, see ingest.py. the comment has no id until written,
+        # clients resolve its receipt to the id once it is
+        receipt = ingest.submit(aid, request.user.id, req_data['content'])
+        if receipt is None:
+            response = HttpResponse(status=503)
+            response['Retry-After'] = 1
+            return response
+
+        response_dict = {
+            'article': aid,
+            'content': req_data['content'],
+            'author': request.user.id,
+            'receipt': receipt,
         }
-        return JsonResponse(response_dict, status=201)
+        response = JsonResponse(response_dict, status=202)
+        response['Location'] = reverse('comment-receipt', args=[receipt])
+        return response
 
+    new_comment = Comment(article=article, content=req_data['content'], author=request.user)
+    with transaction.atomic():
+        new_comment.save()
+        _count_comments(aid, 1)
+    cache.invalidate('articles', f'article:{aid}', f'article:{aid}:comments')
+    notify.notify(aid)
+
+    response_dict = {
+        'id': new_comment.id,
+        'article': new_comment.article_id,
+        'content': new_comment.content,
+        'author': new_comment.author_id,
+    }
+    return JsonResponse(response_dict, status=201)
+
+@replica_reads
+@condition(etag_func=_comment_etag)
 def comments(request, cid):
     if request.method not in ['GET', 'PUT', 'DELETE']:
         return HttpResponseNotAllowed(['GET', 'PUT', 'DELETE'])
@@ -191,51 +701,81 @@ def comments(request, cid):
     if not request.user.is_authenticated:
         return HttpResponseForbidden()
 
-    try:
-        comment = Comment.objects.get(id=cid)
-    except Comment.DoesNotExist:
-        return HttpResponseNotFound()
-
     if request.method == 'GET':
-        # view article
-        response_dict = {
-            'id': comment.id,
-            'article': comment.article_id,
-            'content': comment.content,
-            'author': comment.author_id,
-        }
-        return JsonResponse(response_dict)
+        # view comment, reading only the requested fields
+        try:
+            columns = _columns(request, COMMENT_COLUMNS)
+        except KeyError:
+            return HttpResponseBadRequest()
 
-    elif request.method == 'PUT':
-        # edit comment
-        if request.user != comment.author:
-            return HttpResponseForbidden()
+        comment = _get_comment(cid, columns)
+        if comment is None:
+            return HttpResponseNotFound()
+        return JsonResponse(_rename({column: comment[column] for column in columns}))
+
+    # as in article(), writes only match the user's own comment
+    owned = Comment.objects.filter(id=cid, author=request.user)
 
+    if request.method == 'PUT':
+        # edit comment
         try:
-            req_data = json.loads(request.body)
-            content = req_data['content']
-        except (ValueError, KeyError):
-            return HttpResponseBadRequest()
+            req_data = parsing.parse(request, COMMENT_FIELDS, settings.BLOG_MAX_BODY_SIZE)
+        except parsing.ParseError as error:
+            return _denied(Comment, cid, request.user) or error.response()
+        content = req_data['content']
 
-        comment.content = content
-        comment.save()
+        with transaction.atomic():
+            if not owned.update(content=content, version=F('version') + 1):
+                return _denied(Comment, cid, request.user) or HttpResponseNotFound()
+            aid = owned.values_list('article_id', flat=True).get()
+        cache.invalidate(f'comment:{cid}', f'article:{aid}:comments')
 
         response_dict = {
-            'id': comment.id,
-            'article': comment.article_id,
-            'content': comment.content,
-            'author': comment.author_id,
+            'id': cid,
+            'article': aid,
+            'content': content,
+            'author': request.user.id,
         }
         return JsonResponse(response_dict)
 
     else: # request.method == 'DELETE':
         # delete comment
-        if request.user != comment.author:
-            return HttpResponseForbidden()
-
-        comment.delete()
+        with transaction.atomic():
+            # the article is needed to update its comment_count. the delete
+            # is still filtered on the author, and only counted if it matched
+            aid = owned.values_list('article_id', flat=True).first()
+            if aid is None or not owned.delete()[0]:
+                return _denied(Comment, cid, request.user) or HttpResponseNotFound()
+            _count_comments(aid, -1)
+        cache.invalidate(f'comment:{cid}', 'articles', f'article:{aid}', f'article:{aid}:comments')
         return HttpResponse(status=200)
 
+def comment_receipt(request, receipt):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden()
+
+    # the id of a queued comment, see ingest.py. 202 while it waits, 404 if
+    # it was dropped
+    cid = ingest.resolve(receipt)
+    if cid is ingest.QUEUED:
+        return JsonResponse({'id': None}, status=202)
+    if cid is None:
+        return HttpResponseNotFound()
+    return JsonResponse({'id': cid})
+
+def cache_stats(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden()
+
+    # the counters are per worker process, the pid tells them apart
+    return JsonResponse(dict(cache.stats(), pid=os.getpid()))
+
 @ensure_csrf_cookie
 def token(request):
     if request.method == 'GET':
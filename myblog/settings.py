@@ -41,11 +41,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # inactive unless BLOG_SERVER_TIMING is set
+    'blog.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'blog.auth.BearerTokenMiddleware',
+    # inactive unless BLOG_REPLICAS is set
+    'blog.routers.PinPrimaryMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -78,7 +83,134 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # reuse connections across requests instead of reopening every time
+        'CONN_MAX_AGE': 600,
+    },
+    # a read replica, used when listed in BLOG_REPLICAS and filled by
+    # `python manage.py sync_replicas`. tests read the default database
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+# GET requests to the article and comment views read from BLOG_REPLICAS,
+# see blog/routers.py
+DATABASE_ROUTERS = ['blog.routers.ReplicaRouter']
+
+# applied to every new sqlite connection, see blog.signals. WAL lets readers
+# and the writer proceed concurrently, and with it synchronous=NORMAL is still
+# safe against corruption. busy_timeout makes writers wait for the lock
+# instead of failing with "database is locked"
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # negative means KiB rather than pages
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+}
+
+
+# Caches
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # read-through cache for article and comment reads, see blog/cache.py
+    'blog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blog',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # the generation tokens of the blog cache. shared by every worker
+    # process, so that a write in one invalidates the values the others
+    # cached too. the values stay in each process's own 'blog' cache, a
+    # token only needs to outlive them. on disk like the sessions below
+    'blog_tokens': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'blog'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # sessions, see SESSION_ENGINE. shared by every worker process, so that
+    # signing out in one ends the session in all of them: a process-local
+    # cache would keep serving the signed-out session elsewhere until it
+    # expired. on disk, as the workers share a host with the sqlite database;
+    # each write lists the directory to cull it, keep MAX_ENTRIES moderate
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'sessions'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # receipts of queued comments, see blog/ingest.py. shared by every worker
+    # process, so that a receipt resolves through any of them. written once
+    # per batch of comments
+    'receipts': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'receipts'),
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # rate limit buckets, see blog/throttle.py. separate, so that a flood of
+    # distinct usernames can't evict anything else, and shared by every
+    # worker process like the sessions, or each would keep its own buckets
+    # and the limits would multiply by the number of workers. only allowed
+    # requests write, so the culling cost falls on signins that go on to hash
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'throttle'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/2.2/topics/http/sessions/#using-cached-sessions
+
+# sessions are read from the cache and only fall back to django_session on a
+# miss, so sessions stored by the plain db engine keep working as they are.
+# writes still go through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/2.2/topics/auth/passwords/#using-argon2-with-django
+
+# django's default hashers, with work factors from BLOG_PASSWORD_WORK_FACTORS
+PASSWORD_HASHERS = [
+    'blog.hashers.PBKDF2PasswordHasher',
+    'blog.hashers.PBKDF2SHA1PasswordHasher',
+    'blog.hashers.Argon2PasswordHasher',
+    'blog.hashers.BCryptSHA256PasswordHasher',
+]
+
+# django 2.2's defaults. run `python manage.py calibrate_hashers` on the
+# production host for values that fit its CPU; stored passwords move to new
+# values as their users sign in
+BLOG_PASSWORD_WORK_FACTORS = {
+    'pbkdf2_sha256': {'iterations': 150000},
+    'pbkdf2_sha1': {'iterations': 150000},
+    'argon2': {'time_cost': 2, 'memory_cost': 512, 'parallelism': 2},
+    'bcrypt_sha256': {'rounds': 12},
 }
 
 
@@ -119,3 +251,66 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Blog API
+
+# default and maximum number of rows returned per page by list endpoints
+BLOG_PAGE_SIZE = 100
+BLOG_MAX_PAGE_SIZE = 1000
+
+# number of rows encoded per chunk by ?stream=1 list responses
+BLOG_STREAM_CHUNK_SIZE = 500
+
+# lifetime of bearer tokens from /api/bearer/, and of their cached user lookups
+BLOG_TOKEN_MAX_AGE = 60 * 60
+BLOG_TOKEN_USER_CACHE_TIMEOUT = 60
+
+# maximum number of items in one bulk (JSON array) POST
+BLOG_BULK_MAX_ITEMS = 1000
+
+# request body limits in bytes, see blog/parsing.py: sign up and sign in,
+# single articles and comments, and endpoints that take bulk lists
+BLOG_AUTH_MAX_BODY_SIZE = 4 * 1024
+BLOG_MAX_BODY_SIZE = 1024 * 1024
+BLOG_BULK_MAX_BODY_SIZE = 16 * 1024 * 1024
+
+# (requests, seconds) token buckets for signup, signin and bearer, per client
+# ip and per username, see blog/throttle.py. None turns a limit off
+BLOG_THROTTLE_RATES = {
+    'ip': (30, 60),
+    'username': (10, 60),
+}
+
+# addresses or networks of the reverse proxies in front of the server, whose
+# X-Forwarded-For headers give the client ip for the per ip limits. behind a
+# proxy that isn't listed here, all requests share the proxy's bucket, so a
+# few clients would lock everyone out of signing in
+BLOG_TRUSTED_PROXIES = []
+
+# database aliases of read replicas, e.g. ['replica'], see blog/routers.py.
+# after a write, clients read from the primary for BLOG_REPLICA_PIN_SECONDS,
+# which should be longer than replicas ever lag behind
+BLOG_REPLICAS = []
+BLOG_REPLICA_PIN_SECONDS = 30
+
+# with a queue size, single comment POSTs are queued and answered with 202,
+# then committed by a background thread up to BLOG_COMMENT_QUEUE_BATCH per
+# transaction, see blog/ingest.py. 0 writes each comment synchronously
+BLOG_COMMENT_QUEUE_SIZE = 0
+BLOG_COMMENT_QUEUE_BATCH = 500
+
+# longest ?wait= a comment list long poll may hold a request for, in seconds
+BLOG_LONG_POLL_MAX_WAIT = 30
+
+# default number of comments embedded per article by ?include=comments on the
+# article list
+BLOG_INCLUDE_COMMENT_LIMIT = 10
+
+# per-request Server-Timing headers, see blog/timing.py. requests over any of
+# the thresholds are logged to blog.timing
+BLOG_SERVER_TIMING = False
+BLOG_TIMING_SLOW_MS = 500
+BLOG_TIMING_MAX_QUERIES = 20
+# the same SQL this many times in one request suggests an N+1 pattern
+BLOG_TIMING_REPEATED_QUERIES = 5